@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import PIL
+from PIL import Image
+from resize_core import ResizeEngine, new_result, read_source, resize_image, write_output, output_params
+from thumb_cache import make_thumbnail
+from stage_timing import percentiles
+
+# Benchmarks the hot paths: the scan, the 1080p resize/encode and the sorter's
+# thumbnail generation, over a synthetic corpus. Each mode runs in its own
+# child process so peak RSS is measured per mode. Results are JSON, meant to
+# be saved and diffed between versions:
+#   python benchmark.py --count 40 --sizes 6000x4000,3000x2000 --out before.json
+
+MODES = ("scan", "resize-serial", "resize-parallel", "resize-draft",
+         "thumbs-serial", "thumbs-parallel", "thumbs-draft")
+FORMATS = {"jpg": "JPEG", "png": "PNG", "tiff": "TIFF"}
+THUMB_SIZE = (120, 120)
+
+
+def make_corpus(corpus_dir, count, sizes, formats):
+    # Noise over a gradient: compresses roughly like a real photo, unlike a flat fill
+    os.makedirs(corpus_dir, exist_ok=True)
+    for i in range(count):
+        w, h = sizes[i % len(sizes)]
+        ext = formats[i % len(formats)]
+        path = os.path.join(corpus_dir, f"dir{i % 4}", f"img{i:04d}.{ext}")
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        gradient = Image.linear_gradient("L").resize((w, h))
+        noise = Image.effect_noise((w, h), 24)
+        img = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+        if i % 2:
+            img = img.transpose(Image.Transpose.ROTATE_90)
+        img.save(path, FORMATS[ext])
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+# Pool worker: one file through the same stages ResizeEngine uses, timed
+def timed_resize(src_root, dst_root, rel_path, draft):
+    result = new_result(rel_path)
+    t0 = time.perf_counter()
+    source = read_source(src_root, dst_root, rel_path, False, output_params(draft), None, result)
+    t1 = time.perf_counter()
+    _, [(_, data, _)], timings = resize_image(source, False, draft, timing=True)
+    t2 = time.perf_counter()
+    write_output(dst_root, rel_path, data)
+    t3 = time.perf_counter()
+    return {"read": t1 - t0, **timings, "write": t3 - t2, "total": t3 - t0}
+
+
+def timed_thumbnail(src_root, rel_path, draft):
+    t0 = time.perf_counter()
+    make_thumbnail(os.path.join(src_root, rel_path), THUMB_SIZE, draft).load()
+    return {"thumbnail": time.perf_counter() - t0}
+
+
+def run_mode(mode, corpus_dir, workers):
+    engine = ResizeEngine(corpus_dir, "")
+    start = time.perf_counter()
+    engine.scan()
+    scan_seconds = time.perf_counter() - start
+    files = engine.source_list
+    if mode == "scan":
+        return {"files": len(files), "mb": engine.total_input_size / (1024 * 1024), "seconds": scan_seconds,
+                "timings": []}
+
+    kind, variant = mode.split("-")
+    draft = variant == "draft"
+    pool_size = 1 if variant == "serial" else workers
+    dst_root = tempfile.mkdtemp(prefix="bench_out_")
+    try:
+        start = time.perf_counter()
+        if pool_size == 1:
+            if kind == "resize":
+                timings = [timed_resize(corpus_dir, dst_root, f, draft) for f in files]
+            else:
+                timings = [timed_thumbnail(corpus_dir, f, draft) for f in files]
+        else:
+            with ProcessPoolExecutor(max_workers=pool_size) as pool:
+                if kind == "resize":
+                    timings = list(pool.map(timed_resize, [corpus_dir] * len(files), [dst_root] * len(files),
+                                            files, [draft] * len(files)))
+                else:
+                    timings = list(pool.map(timed_thumbnail, [corpus_dir] * len(files), files,
+                                            [draft] * len(files)))
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(dst_root, ignore_errors=True)
+    return {"files": len(files), "mb": engine.total_input_size / (1024 * 1024), "seconds": seconds,
+            "workers": pool_size, "draft": draft, "timings": timings}
+
+
+def summarize(raw):
+    summary = {k: v for k, v in raw.items() if k != "timings"}
+    seconds = raw["seconds"] or 1e-9
+    summary["seconds"] = round(seconds, 3)
+    summary["mb"] = round(raw["mb"], 2)
+    summary["files_per_sec"] = round(raw["files"] / seconds, 2)
+    summary["mb_per_sec"] = round(raw["mb"] / seconds, 2)
+    stages = raw["timings"][0].keys() if raw["timings"] else ()
+    summary["latency"] = {stage: percentiles([t[stage] for t in raw["timings"]]) for stage in stages}
+    summary["peak_rss_mb"], summary["peak_worker_rss_mb"] = peak_rss_mb()
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_sizes(text):
+    return [tuple(int(n) for n in size.split("x")) for size in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scan, resize and thumbnail hot paths.")
+    parser.add_argument("--count", type=int, default=24, help="images in the synthetic corpus")
+    parser.add_argument("--sizes", default="6000x4000,4000x3000", help="comma-separated WxH list")
+    parser.add_argument("--formats", default="jpg,png,tiff", help="comma-separated: " + ",".join(FORMATS))
+    parser.add_argument("--corpus", help="corpus directory to create or reuse (default: temporary)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="pool size for parallel modes")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated: " + ",".join(MODES))
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(summarize(run_mode(args.child, args.corpus, args.workers))))
+        return 0
+
+    formats = args.formats.split(",")
+    modes = args.modes.split(",")
+    for name in formats:
+        if name not in FORMATS:
+            parser.error(f"unknown format: {name}")
+    for name in modes:
+        if name not in MODES:
+            parser.error(f"unknown mode: {name}")
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="bench_corpus_")
+    try:
+        make_corpus(corpus_dir, args.count, parse_sizes(args.sizes), formats)
+        results = {}
+        for mode in modes:
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                    "--corpus", corpus_dir, "--workers", str(args.workers)],
+                                   capture_output=True, text=True)
+            if child.returncode:
+                results[mode] = {"error": child.stderr.strip().splitlines()[-1:]}
+            else:
+                results[mode] = json.loads(child.stdout)
+            print(f"{mode}: {results[mode]}", file=sys.stderr)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corpus": {"count": args.count, "sizes": args.sizes, "formats": args.formats},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Finds byte-identical files. Files are bucketed by size first, so a file
+# with a unique size is never read; within a size bucket only the first and
+# last PARTIAL_BYTES are hashed, and only files that still collide are
+# hashed in full. Hashes are cached in SQLite and reused while the file's
+# size and mtime are unchanged.
+
+INDEX_PATH = "dup_index.db"
+INDEX_NAME = ".dup_index.db"  # the resizer's, kept in the destination
+HASH_THREADS = 8
+PARTIAL_BYTES = 64 * 1024
+COMMIT_EVERY = 200
+
+
+def partial_hash(path, size):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES * 2:
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+        digest.update(f.read(PARTIAL_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DuplicateIndex:
+
+    def __init__(self, path=INDEX_PATH, threads=HASH_THREADS):
+        self.threads = max(1, threads)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                partial TEXT,
+                full TEXT
+            )""")
+        self.db.commit()
+
+    def cached(self, path, st):
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime_ns, partial, full FROM hashes WHERE path=?",
+                                  (path,)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None, None
+        return row[2], row[3]
+
+    def store(self, path, st, partial, full):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                            (path, st.st_size, st.st_mtime_ns, partial, full))
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.db.commit()
+                self.pending = 0
+
+    def hash_file(self, path, full):
+        # (partial, full) for one file; full is None unless asked for. Any
+        # error (file gone, unreadable) gives (None, None): never a duplicate.
+        try:
+            path = os.path.abspath(path)
+            st = os.stat(path)
+            partial, whole = self.cached(path, st)
+            if partial is None or (full and whole is None):
+                if partial is None:
+                    partial = partial_hash(path, st.st_size)
+                if full and whole is None:
+                    # Small files were hashed whole by partial_hash already
+                    whole = full_hash(path) if st.st_size > PARTIAL_BYTES * 2 else partial
+                self.store(path, st, partial, whole)
+            return partial, whole
+        except OSError:
+            return None, None
+
+    def find(self, files, cancelled=None):
+        # files: [(path, size)]. Returns groups of identical files, each a list
+        # of paths in the order given, so the first of a group is the one to keep.
+        order = {path: i for i, (path, _) in enumerate(files)}
+        sizes = dict(files)
+        by_size = {}
+        for path, size in files:
+            by_size.setdefault(size, []).append(path)
+        candidates = [path for size, paths in by_size.items() if len(paths) > 1 and size > 0 for path in paths]
+
+        groups = []
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for full in (False, True):
+                if cancelled and cancelled():
+                    return []
+                buckets = {}
+                for path, (partial, whole) in zip(candidates, pool.map(lambda p: self.hash_file(p, full),
+                                                                       candidates)):
+                    key = whole if full else partial
+                    if key is not None:
+                        buckets.setdefault((sizes[path], key), []).append(path)
+                groups = [paths for paths in buckets.values() if len(paths) > 1]
+                candidates = [path for paths in groups for path in paths]
+        self.commit()
+        return sorted((sorted(paths, key=order.get) for paths in groups), key=lambda g: order[g[0]])
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
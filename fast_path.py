@@ -0,0 +1,88 @@
+import struct
+
+# Picks the cheapest way to make each rendition of a source (see
+# output_profiles), counted per run as the "methods" summary:
+#   copy      the source already is the rendition: same format and size
+#             (profiles don't upscale unless told to), so its bytes are
+#             written as they are, minus any JPEG metadata the profile strips
+#   link      a copy whose bytes are unchanged, hard-linked to the source
+#             when the engine is asked to (editing one then edits both)
+#   dct       a JPEG exactly 2, 4 or 8 times the rendition's size: draft()
+#             decodes straight to it in the DCT domain, no resample needed
+#   encode    same size, other format: decoded and encoded only
+#   resample  everything else
+
+METHODS = ("copy", "link", "dct", "encode", "resample")
+DCT_SCALES = (2, 4, 8)
+# APPn segments kept when JPEG metadata is stripped: APP0 (JFIF) and APP14
+# (Adobe, which says how the colour channels are coded)
+KEEP_SEGMENTS = {0xE0, 0xEE}
+
+
+def can_copy(fmt, w, h, size, profile):
+    # PNG and TIFF metadata isn't stripped here, so those only copy when kept
+    return (fmt == profile["format"] and size == (w, h)
+            and (profile["metadata"] == "keep" or fmt == "JPEG"))
+
+
+def dct_exact(fmt, w, h, size, draft):
+    return draft and fmt == "JPEG" and any(w == size[0] * s and h == size[1] * s for s in DCT_SCALES)
+
+
+def plan_methods(fmt, w, h, sizes, profiles, draft):
+    # Method per rendition, as resize_image will pick them: the decode is
+    # sized for the largest rendition that isn't copied, which comes
+    # straight from it; smaller ones are resampled from it
+    copied = [can_copy(fmt, w, h, size, profile) for size, profile in zip(sizes, profiles)]
+    largest = max((size for size, copy in zip(sizes, copied) if not copy), default=None)
+    methods = []
+    for size, copy in zip(sizes, copied):
+        if copy:
+            methods.append("copy")
+        elif size == (w, h):
+            methods.append("encode")
+        elif size == largest and dct_exact(fmt, w, h, size, draft):
+            methods.append("dct")
+        else:
+            methods.append("resample")
+    return methods
+
+
+def copy_bytes(data, fmt, profile):
+    if fmt == "JPEG" and profile["metadata"] != "keep":
+        return strip_jpeg_metadata(data)
+    return data
+
+
+def strip_jpeg_metadata(data):
+    # Drops APPn (bar KEEP_SEGMENTS) and comment segments ahead of the scan.
+    # Returns data itself when there is nothing to drop or the header isn't
+    # understood.
+    if data[:2] != b'\xff\xd8':
+        return data
+    parts = [data[:2]]
+    pos = 2
+    dropped = False
+    while True:
+        if pos + 4 > len(data) or data[pos] != 0xFF:
+            return data
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA:  # start of scan: the rest is image data
+            break
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # no length
+            parts.append(data[pos:pos + 2])
+            pos += 2
+            continue
+        end = pos + 2 + struct.unpack_from('>H', data, pos + 2)[0]
+        if (0xE1 <= marker <= 0xEF and marker not in KEEP_SEGMENTS) or marker == 0xFE:
+            dropped = True
+        else:
+            parts.append(data[pos:end])
+        pos = end
+    if not dropped:
+        return data
+    parts.append(data[pos:])
+    return b"".join(parts)
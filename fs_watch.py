@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+# Watches a folder (optionally a whole tree) for image files being added,
+# changed or removed, so the tools can update what they hold instead of
+# rescanning. Uses inotify on Linux and polls directory listings elsewhere
+# (or if inotify can't be set up). A poll re-lists the whole tree, so the
+# interval grows with the tree: at least poll_seconds, a millisecond per
+# file, and POLL_IDLE_RATIO times as long as the last pass took (a 100k-file
+# NAS share is looked at every few minutes, not every few seconds).
+#
+# take_changes() returns {rel_path: "changed" | "removed"}, the last thing
+# that happened to each path, once it has been quiet for SETTLE_SECONDS (so
+# a file still being copied isn't picked up half written). "changed" means
+# the file exists and may be new; "removed" may name a folder, meaning
+# everything below it. Either way the consumer should check the disk: a
+# rename chain, say, can remove a name and bring it back. If the watcher
+# loses track (the kernel's event queue overflowed), lost is set and only a
+# rescan will do.
+
+POLL_SECONDS = 2.0
+POLL_SECONDS_PER_FILE = 0.001
+POLL_IDLE_RATIO = 20
+SETTLE_SECONDS = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def file_stamp(path):
+    # (size, mtime_ns), or None if there is no such file
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FolderWatcher:
+
+    def __init__(self, root, types, recursive=True, poll_seconds=POLL_SECONDS):
+        self.root = root
+        self.types = tuple(types)
+        self.recursive = recursive
+        self.poll_seconds = poll_seconds
+        self.poll_interval = poll_seconds  # current, see poll_loop
+        self.lock = threading.Lock()
+        self.pending = {}  # rel_path -> (kind, time of the last event)
+        self.lost = False
+        self.stopped = False
+        self.fd = None
+        self.watches = {}  # inotify watch descriptor -> rel dir
+        self.mode = "polling"
+
+    def start(self):
+        libc = load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.libc, self.fd = libc, fd
+                try:
+                    self.add_tree("")
+                    self.mode = "inotify"
+                except OSError:
+                    # Typically the per-user watch limit; polling still works
+                    os.close(fd)
+                    self.fd = None
+                    self.watches.clear()
+        target = self.inotify_loop if self.mode == "inotify" else self.poll_loop
+        threading.Thread(target=target, daemon=True).start()
+
+    def stop(self):
+        self.stopped = True
+
+    def wanted(self, name):
+        return name.lower().endswith(self.types)
+
+    def note(self, rel_path, kind):
+        with self.lock:
+            self.pending[rel_path] = (kind, time.monotonic())
+
+    def take_changes(self):
+        settled = time.monotonic() - SETTLE_SECONDS
+        with self.lock:
+            ready = {path: kind for path, (kind, when) in self.pending.items() if when <= settled}
+            for path in ready:
+                del self.pending[path]
+        return ready
+
+    # inotify
+
+    def add_watch(self, rel_dir):
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.watches[wd] = rel_dir
+
+    def add_tree(self, rel_dir, report=False):
+        # Watches rel_dir (and below, if recursive). With report, files
+        # already in it are noted as changed: they may have arrived before
+        # the watch did.
+        self.add_watch(rel_dir)
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        with os.scandir(path) as it:
+            entries = list(it)
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive and not entry.name.startswith("."):
+                        self.add_tree(rel_path, report)
+                elif report and self.wanted(entry.name):
+                    self.note(rel_path, "changed")
+            except FileNotFoundError:
+                pass  # gone again already
+
+    def inotify_loop(self):
+        try:
+            while not self.stopped:
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        continue
+                    raise
+                offset = 0
+                while offset < len(data):
+                    wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size
+                    name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                    offset += length
+                    self.handle_event(wd, mask, name)
+        except OSError:
+            self.lost = True
+        finally:
+            os.close(self.fd)
+
+    def handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self.lost = True
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        rel_dir = self.watches.get(wd)
+        if rel_dir is None or not name:
+            return  # DELETE_SELF / MOVE_SELF: the parent's event says what happened
+        rel_path = os.path.join(rel_dir, name) if rel_dir else name
+        if mask & IN_ISDIR:
+            if not self.recursive or name.startswith("."):
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.add_tree(rel_path, report=True)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    self.lost = True
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.note(rel_path, "removed")
+        elif self.wanted(name):
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.note(rel_path, "removed")
+            elif mask & (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.note(rel_path, "changed")
+
+    # polling
+
+    def snapshot(self):
+        # {rel_path: (size, mtime_ns)} of every wanted file
+        files = {}
+        dirs = [""]
+        while dirs:
+            rel_dir = dirs.pop()
+            try:
+                with os.scandir(os.path.join(self.root, rel_dir) if rel_dir else self.root) as it:
+                    for entry in it:
+                        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self.recursive and not entry.name.startswith("."):
+                                    dirs.append(rel_path)
+                            elif self.wanted(entry.name):
+                                st = entry.stat()
+                                files[rel_path] = (st.st_size, st.st_mtime_ns)
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+        return files
+
+    def timed_snapshot(self):
+        started = time.monotonic()
+        files = self.snapshot()
+        self.poll_interval = max(self.poll_seconds, len(files) * POLL_SECONDS_PER_FILE,
+                                 (time.monotonic() - started) * POLL_IDLE_RATIO)
+        return files
+
+    def poll_loop(self):
+        before = self.timed_snapshot()
+        while not self.stopped:
+            # Sleep in short steps so stop() doesn't wait out a long interval
+            wake = time.monotonic() + self.poll_interval
+            while not self.stopped and time.monotonic() < wake:
+                time.sleep(min(0.5, self.poll_seconds))
+            if self.stopped:
+                break
+            now = self.timed_snapshot()
+            for rel_path, stamp in now.items():
+                if before.get(rel_path) != stamp:
+                    self.note(rel_path, "changed")
+            for rel_path in before.keys() - now.keys():
+                self.note(rel_path, "removed")
+            before = now
@@ -0,0 +1,120 @@
+import io
+import struct
+
+# Header-only probing: reads width, height, EXIF orientation, band count and
+# bit depth from the JPEG SOF / PNG IHDR / TIFF IFD0 bytes without decoding
+# any pixels, and usually without reading past the first few KB of the file.
+# probe_image returns None for anything it doesn't understand; callers then
+# fall back to PIL.
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) don't
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+PNG_BANDS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+TAG_WIDTH, TAG_HEIGHT, TAG_BITS, TAG_ORIENTATION, TAG_SAMPLES = 256, 257, 258, 274, 277
+
+
+def probe_image(source):
+    # source: a path, or the file's bytes
+    try:
+        with io.BytesIO(source) if isinstance(source, bytes) else open(source, 'rb') as f:
+            head = f.read(8)
+            if head[:2] == b'\xff\xd8':
+                return probe_jpeg(f)
+            if head == b'\x89PNG\r\n\x1a\n':
+                return probe_png(f)
+            if head[:4] in (b'II*\x00', b'MM\x00*'):
+                return probe_tiff(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+# Orientations 5-8 are transposed, so the displayed image is h x w
+def oriented_size(info):
+    if info["orientation"] in (5, 6, 7, 8):
+        return info["height"], info["width"]
+    return info["width"], info["height"]
+
+
+def probe_jpeg(f):
+    f.seek(2)
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        m = marker[0]
+        if m == 0x01 or 0xD0 <= m <= 0xD8:  # markers without a length
+            continue
+        if m in (0xD9, 0xDA):  # EOI or start of scan before any frame header
+            return None
+        length = struct.unpack('>H', f.read(2))[0]
+        if m in JPEG_SOF:
+            bits, height, width, bands = struct.unpack('>BHHB', f.read(6))
+            return {"format": "JPEG", "width": width, "height": height, "orientation": orientation,
+                    "bands": bands, "bits": bits}
+        if m == 0xE1:
+            segment = f.read(length - 2)
+            if segment.startswith(b'Exif\x00\x00'):
+                tags = read_ifd0(io.BytesIO(segment[6:]))
+                if tags:
+                    orientation = tags.get(TAG_ORIENTATION, orientation)
+        else:
+            f.seek(length - 2, 1)
+
+
+def probe_png(f):
+    length, chunk = struct.unpack('>I4s', f.read(8))
+    if chunk != b'IHDR':
+        return None
+    width, height, bits, color_type = struct.unpack('>IIBB', f.read(10))
+    return {"format": "PNG", "width": width, "height": height, "orientation": 1,
+            "bands": PNG_BANDS.get(color_type, 4), "bits": bits}
+
+
+def probe_tiff(f):
+    tags = read_ifd0(f)
+    if not tags or TAG_WIDTH not in tags or TAG_HEIGHT not in tags:
+        return None
+    return {"format": "TIFF", "width": tags[TAG_WIDTH], "height": tags[TAG_HEIGHT],
+            "orientation": tags.get(TAG_ORIENTATION, 1), "bands": tags.get(TAG_SAMPLES, 1),
+            "bits": tags.get(TAG_BITS, 8)}
+
+
+def read_ifd0(f):
+    # f starts at a TIFF header (a TIFF file, or the body of an EXIF segment)
+    f.seek(0)
+    header = f.read(8)
+    if header[:2] == b'II':
+        order = '<'
+    elif header[:2] == b'MM':
+        order = '>'
+    else:
+        return None
+    magic, offset = struct.unpack(order + 'HI', header[2:8])
+    if magic != 42:  # 43 is BigTIFF, not handled here
+        return None
+    f.seek(offset)
+    count = struct.unpack(order + 'H', f.read(2))[0]
+    entries = f.read(12 * count)
+
+    tags = {}
+    for i in range(count):
+        tag, kind, n, value = struct.unpack(order + 'HHI4s', entries[12 * i:12 * i + 12])
+        if tag not in (TAG_WIDTH, TAG_HEIGHT, TAG_BITS, TAG_ORIENTATION, TAG_SAMPLES):
+            continue
+        if kind == 3:  # SHORT: inline when up to two fit, else value is an offset
+            if n > 2:
+                f.seek(struct.unpack(order + 'I', value)[0])
+                value = f.read(2)
+            tags[tag] = struct.unpack(order + 'H', value[:2])[0]
+        elif kind == 4:  # LONG
+            tags[tag] = struct.unpack(order + 'I', value)[0]
+    return tags
@@ -0,0 +1,112 @@
+import io
+import os
+import json
+from PIL import Image
+
+# Output profiles: what the resizer writes for each source image. A run can
+# have several; all are rendered from one decode (see resize_core).
+#
+# A profile is a dict:
+#   name         None for the classic single output (same relative path as
+#                the source), else outputs go to dst/<name>/ with the
+#                format's extension
+#   target       short edge in pixels
+#   filter       a PIL resampling filter name (LANCZOS, BICUBIC, ...)
+#   format       JPEG, WEBP or PNG
+#   quality      JPEG / WebP quality
+#   subsampling  JPEG chroma subsampling ("4:4:4", "4:2:2", "4:2:0") or None for Pillow's default
+#   progressive  progressive JPEG
+#   metadata     "strip" or "keep" (EXIF and ICC profile copied from the source)
+#   upscale      enlarge sources smaller than target; by default they keep
+#                their size (and are copied as they are if already in format,
+#                see fast_path)
+
+DEFAULTS = {"name": None, "target": 1080, "filter": "LANCZOS", "format": "JPEG", "quality": 95,
+            "subsampling": None, "progressive": False, "metadata": "strip", "upscale": False}
+PRESETS = {
+    "1080": {"name": "1080", "target": 1080},
+    "2160": {"name": "2160", "target": 2160, "quality": 92},
+    "web320": {"name": "web320", "target": 320, "format": "WEBP", "quality": 80},
+}
+EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}
+# Rough encoded size per output pixel, for test-mode estimates
+BYTES_PER_PIXEL = {"JPEG": 0.4, "WEBP": 0.25, "PNG": 2.0}
+# Modes PNG stores as they are; 32-bit integer images go as 16-bit, others
+# (CMYK, YCbCr, ...) as RGB
+PNG_MODES = {"1", "L", "LA", "P", "RGB", "RGBA", "I;16"}
+
+
+def make_profile(**options):
+    profile = dict(DEFAULTS, **options)
+    profile["format"] = profile["format"].upper()
+    if profile["format"] not in EXTENSIONS:
+        raise ValueError(f"unsupported output format: {profile['format']}")
+    if profile["filter"] not in Image.Resampling.__members__:
+        raise ValueError(f"unknown resampling filter: {profile['filter']}")
+    return profile
+
+
+def default_profiles(target=DEFAULTS["target"]):
+    return [make_profile(target=target)]
+
+
+def load_profiles(spec):
+    # spec: a JSON file holding a list of profile dicts, or comma-separated
+    # preset names ("1080,2160,web320")
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            return [make_profile(**options) for options in json.load(f)]
+    profiles = []
+    for name in spec.split(","):
+        name = name.strip()
+        if name not in PRESETS:
+            raise ValueError(f"unknown profile: {name} (presets: {', '.join(PRESETS)}; or a JSON file)")
+        profiles.append(make_profile(**PRESETS[name]))
+    return profiles
+
+
+def profile_key(profile):
+    # Everything that changes the bytes written. Outputs from before small
+    # sources stopped being upscaled were recorded without :noupscale, so
+    # those files are redone once; an upscaling profile keeps the old key.
+    key = f"{profile['target']}:{profile['filter']}:{profile['format']}:q{profile['quality']}"
+    if profile["subsampling"]:
+        key += f":ss{profile['subsampling']}"
+    if profile["progressive"]:
+        key += ":progressive"
+    if profile["metadata"] == "keep":
+        key += ":meta"
+    if not profile["upscale"]:
+        key += ":noupscale"
+    return f"{profile['name']}={key}" if profile["name"] else key
+
+
+def output_path(rel_path, profile):
+    if not profile["name"]:
+        return rel_path
+    return os.path.join(profile["name"], os.path.splitext(rel_path)[0] + EXTENSIONS[profile["format"]])
+
+
+def encode(img, profile, source_info):
+    fmt = profile["format"]
+    options = {}
+    if fmt in ("JPEG", "WEBP"):
+        options["quality"] = profile["quality"]
+    if fmt == "JPEG":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if profile["subsampling"]:
+            options["subsampling"] = profile["subsampling"]
+        if profile["progressive"]:
+            options["progressive"] = True
+    elif fmt == "WEBP" and img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.mode else "RGB")
+    elif fmt == "PNG" and img.mode not in PNG_MODES:
+        img = img.convert("I;16" if img.mode == "I" else "RGBA" if "A" in img.mode else "RGB")
+    if profile["metadata"] == "keep":
+        for key in ("exif", "icc_profile"):
+            if source_info.get(key):
+                options[key] = source_info[key]
+    buf = io.BytesIO()
+    img.save(buf, fmt, **options)
+    return buf.getvalue()
@@ -0,0 +1,170 @@
+import os
+import re
+import heapq
+import sqlite3
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# Capture time, camera and orientation from each photo's EXIF, read on a
+# thread pool (Image.open only parses the header) and cached in SQLite
+# while the file's size and mtime are unchanged. order_files turns them
+# into the sorter's initial orderings.
+
+META_PATH = "meta_cache.db"
+META_THREADS = 8
+COMMIT_EVERY = 200
+EPOCH = datetime.datetime(1970, 1, 1)
+TAG_MAKE, TAG_MODEL, TAG_ORIENTATION, TAG_DATETIME = 271, 272, 274, 306
+TAG_EXIF_IFD, TAG_ORIGINAL, TAG_DIGITIZED, TAG_SUBSEC_ORIGINAL = 0x8769, 36867, 36868, 37521
+
+# name: label, in the order offered in the sorter
+ORDERINGS = {
+    "name": "Name",
+    "capture": "Capture Time",
+    "cameras": "Cameras Merged",
+    "mtime": "File Time",
+}
+
+
+def exif_time(value, subsec=None):
+    # "YYYY:MM:DD HH:MM:SS" as seconds since 1970, camera local time (no
+    # time zone is applied, so shots from one trip compare as they read)
+    try:
+        taken = datetime.datetime.strptime(str(value).strip("\x00 ")[:19], "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+    seconds = (taken - EPOCH).total_seconds()
+    digits = str(subsec or "").strip("\x00 ")
+    if digits.isdigit():
+        seconds += int(digits) / 10 ** len(digits)
+    return seconds
+
+
+def read_meta(path):
+    st = os.stat(path)
+    meta = {"capture": None, "camera": None, "orientation": 1, "mtime": st.st_mtime}
+    with Image.open(path) as img:
+        exif = img.getexif()
+    make = str(exif.get(TAG_MAKE, "")).strip("\x00 ")
+    model = str(exif.get(TAG_MODEL, "")).strip("\x00 ")
+    # Models often repeat the make ("Canon" / "Canon EOS R6")
+    meta["camera"] = (model if model.startswith(make) else f"{make} {model}".strip()) or None
+    meta["orientation"] = exif.get(TAG_ORIENTATION, 1)
+    sub = exif.get_ifd(TAG_EXIF_IFD)
+    meta["capture"] = (exif_time(sub.get(TAG_ORIGINAL), sub.get(TAG_SUBSEC_ORIGINAL))
+                       or exif_time(sub.get(TAG_DIGITIZED)) or exif_time(exif.get(TAG_DATETIME)))
+    return st, meta
+
+
+class MetadataIndex:
+
+    def __init__(self, path=META_PATH, threads=META_THREADS):
+        self.threads = max(1, threads)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                capture REAL,
+                camera TEXT,
+                orientation INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            )""")
+        self.db.commit()
+
+    def get(self, path):
+        # Metadata dict for one file, or None if it can't be read
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+            with self.lock:
+                row = self.db.execute("SELECT size, mtime_ns, capture, camera, orientation, mtime FROM meta "
+                                      "WHERE path=?", (path,)).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                return {"capture": row[2], "camera": row[3], "orientation": row[4], "mtime": row[5]}
+            st, meta = read_meta(path)
+        except Exception:
+            return None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (path, st.st_size, st.st_mtime_ns, meta["capture"], meta["camera"],
+                             meta["orientation"], meta["mtime"]))
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.db.commit()
+                self.pending = 0
+        return meta
+
+    def read_all(self, directory, files, cancelled=None):
+        # {filename: metadata or None} for files in directory
+        def one(name):
+            if cancelled and cancelled():
+                return None
+            return self.get(os.path.join(directory, name))
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            result = dict(zip(files, pool.map(one, files)))
+        with self.lock:
+            self.db.commit()
+            self.pending = 0
+        return result
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+def natural_key(name):
+    # IMG_2.jpg before IMG_10.jpg
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def order_files(files, meta, how):
+    # files in the ordering named by how (see ORDERINGS); meta maps a
+    # filename to its metadata dict or None
+    def mtime(name):
+        return meta[name]["mtime"] if meta.get(name) else 0
+
+    def capture(name):
+        m = meta.get(name)
+        return m["capture"] if m and m["capture"] is not None else mtime(name)
+
+    if how == "capture":
+        return sorted(files, key=lambda name: (capture(name), natural_key(name)))
+    if how == "mtime":
+        return sorted(files, key=lambda name: (mtime(name), natural_key(name)))
+    if how == "cameras":
+        # Each camera's own shot sequence (its file numbering) is kept as is,
+        # even where its clock ties or jumps; the sequences are then merged
+        # by time. A shot without a time takes its predecessor's.
+        streams = {}
+        for name in files:
+            m = meta.get(name)
+            streams.setdefault(m["camera"] if m else None, []).append(name)
+        merged = []
+        for names in streams.values():
+            names.sort(key=natural_key)
+            times = [meta[name]["capture"] if meta.get(name) else None for name in names]
+            known = [t for t in times if t is not None]
+            if not known:
+                # No clock at all (no EXIF): file times are all there is
+                merged.append(sorted(((mtime(name), name) for name in names),
+                                     key=lambda item: (item[0], natural_key(item[1]))))
+                continue
+            last = known[0]
+            stream = []
+            for name, t in zip(names, times):
+                if t is not None:
+                    last = max(last, t)
+                stream.append((last, name))
+            merged.append(stream)
+        return [name for _, name in heapq.merge(*merged)]
+    return sorted(files)
@@ -1,11 +1,26 @@
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import filedialog
-from PIL import Image, ImageTk
-import os, json, threading, datetime
+from PIL import ImageTk
+import os, json, datetime, threading, uuid
 from send2trash import send2trash
+from thumb_cache import ThumbnailCache
+from thumb_loader import ThumbnailLoader
+from thumb_store import ThumbStore, PhotoEntry
+from dup_index import DuplicateIndex
+from photo_meta import MetadataIndex, ORDERINGS, order_files
+from similar_index import group_similar
+from rename_txn import plan_renames, run_renames, recover
+from rename_history import RenameHistory
+from sort_session import list_images, index_tree, likely_next, FolderState, SORTABLE_TYPES
+from fs_watch import FolderWatcher, file_stamp
 
 CONFIG_PATH = "config.json"
+VIEW_MARGIN_ROWS = 2  # rows materialized above and below the visible area
+FRAME_MS = 30  # how often finished thumbnails are handed to the grid
+PREFETCH_FOLDERS = 2  # in a whole-tree session, folders whose thumbnails are made ahead
+PREFETCH_WORKERS = 2
+WATCH_MS = 1000  # how often changes seen in the open folder are applied
 
 class DragDropSorter(tk.Tk):
 
@@ -28,17 +43,51 @@ class DragDropSorter(tk.Tk):
         self.protocol("WM_DELETE_WINDOW", self.on_app_close)
         self.thumb_size = (120, 120)
         self.image_directory = ""
+        self.cell_size = (self.thumb_size[0] + 20, self.thumb_size[1] + 20)
         self.max_columns = 6
         self.image_data = []
         self.image_files = []
-        self.selected_widgets = []
+        self.selected = set()
+        self.cell_items = {}  # image_data index -> (rectangle id, image id) for materialized cells
         self.last_clicked_index = None
-        self.dragged_widget = None
+        self.dragged_index = None
+        self.thumb_cache = ThumbnailCache()
+        self.thumb_store = ThumbStore()
+        self.shown = set()  # entries holding a Tk image, i.e. materialized cells
+        self.loader = None
+        self.loading_entries = {}  # filename -> image_data entry still waiting for its thumbnail
+        self.last_range = None
+        self.dup_index = DuplicateIndex()
+        self.dup_token = None  # identifies the current duplicate search
+        self.dup_groups = None  # (token, groups of filenames), set by the search thread
+        self.meta_index = MetadataIndex()
+        self.meta_token = None
+        self.meta_result = None  # (token, {filename: metadata}), set by the reading thread
+        self.pending_order = None  # ordering asked for before the folder finished loading
+        # Whole-tree session: the folders found, which one is open, folders
+        # left after loading (FolderState) and thumbnails made ahead for
+        # folders not opened yet ({folder: {filename: (store slot, dHash)}})
+        self.session_mode = tk.BooleanVar()
+        self.session_root = None
+        self.folders = []
+        self.folder_index = None
+        self.folder_states = {}
+        self.prefetched = {}
+        self.prefetch_loaders = {}
+        self.index_token = None
+        self.index_result = None
+        # The open folder is watched; files changed behind the grid's back
+        # get their thumbnails remade on refresh_loader
+        self.watcher = None
+        self.refresh_loader = None
+        self.refresh_entries = {}
 
         self.load_config()
 
         self.create_ui()
         self.folder_entry.insert(0, self.image_directory)
+        if os.path.isdir(self.image_directory):
+            self.recover_renames()
         #self.start_thumbnail_loading()
 
     def create_ui(self):
@@ -56,36 +105,57 @@ class DragDropSorter(tk.Tk):
         self.browse_button = tk.Button(source_frame, text="Browse...", command=self.choose_directory)
         self.browse_button.pack(side="left")
 
+        tk.Checkbutton(source_frame, text="Whole Tree", variable=self.session_mode).pack(side="left")
+
         source_frame.pack(pady=5)
 
+        session_frame = tk.Frame(self)
+        tk.Button(session_frame, text="◀ Prev", command=lambda: self.step_folder(-1)).pack(side="left")
+        self.folder_var = tk.StringVar(value="(one folder)")
+        self.folder_menu = tk.OptionMenu(session_frame, self.folder_var, "")
+        self.folder_menu.config(width=40)
+        self.folder_menu.pack(side="left", padx=5)
+        tk.Button(session_frame, text="Next ▶", command=lambda: self.step_folder(1)).pack(side="left")
+        session_frame.pack(pady=2)
+
         prefix_frame = tk.Frame(self)
         tk.Label(prefix_frame, text="Filename Prefix:").pack(side="left")
         self.prefix_entry = tk.Entry(prefix_frame)
         self.prefix_entry.pack(side="left", padx=5)
         prefix_frame.pack(pady=5)
 
+        order_frame = tk.Frame(self)
+        tk.Label(order_frame, text="Initial Order:").pack(side="left")
+        for how, label in ORDERINGS.items():
+            tk.Button(order_frame, text=label, command=lambda how=how: self.order_by(how)).pack(side="left")
+        order_frame.pack(pady=2)
+
         tk.Button(self, text="Preview Rename", command=self.preview_order).pack(pady=2)
         tk.Button(self, text="Rename & Save Order", command=self.save_order).pack(pady=2)
-        tk.Button(self, text="Restore From Log", command=self.restore_from_log).pack(pady=2)
+        tk.Button(self, text="Restore Names...", command=self.restore_from_log).pack(pady=2)
+        tk.Button(self, text="Select Similar", command=self.select_similar).pack(pady=2)
 
         self.loading_label = tk.Label(self, text="Click 'Load' to load thumbnails")
         self.loading_label.pack(pady=5)
+        self.dup_label = tk.Label(self, text="", fg="dark orange")
+        self.dup_label.pack()
 
+        # Virtualized grid: cells are drawn straight onto the canvas, and only
+        # the rows in view (plus a margin) have canvas items at any time.
         self.canvas = tk.Canvas(self)
-        self.frame = tk.Frame(self.canvas)
         self.scrollbar = tk.Scrollbar(self, command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        self.canvas.create_window((0, 0), window=self.frame, anchor='nw')
+        self.canvas.configure(yscrollcommand=self.on_canvas_scroll)
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
         self.canvas.configure(yscrollincrement=10)
-        self.frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        self.canvas.bind("<Configure>", lambda e: self.refresh_view())
 
         self.canvas.bind_all("<MouseWheel>", self.on_mousewheel)       # Windows & macOS
         self.canvas.bind_all("<Button-4>", self.on_mousewheel_linux)   # Linux scroll up
         self.canvas.bind_all("<Button-5>", self.on_mousewheel_linux)   # Linux scroll down
-        self.canvas.bind("<Button-1>", self.clear_selection_on_background)
-        self.frame.bind("<Button-1>", self.clear_selection_on_background)  # 👈 Add this
+        self.canvas.bind("<Button-1>", self.on_canvas_press)
+        self.canvas.bind("<B1-Motion>", self.handle_drag_motion)
+        self.canvas.bind("<ButtonRelease-1>", self.finish_drag)
         self.bind_all("<ButtonRelease-1>", self.destroy_drag_cursor)
         self.bind_all("<Delete>", self.delete_selected_thumbnails)        
 
@@ -100,18 +170,208 @@ class DragDropSorter(tk.Tk):
     def load_from_entry(self):
         path = self.folder_entry.get()
         if os.path.exists(path):
+            if not self.confirm_discard():
+                return
             self.image_directory = path
             self.save_config()
+            self.reset_session()
+            if self.session_mode.get():
+                self.start_session(path)
+            else:
+                self.start_thumbnail_loading()
+
+    def reset_session(self):
+        # Everything kept for other folders goes, along with their thumbnails
+        for loader in self.prefetch_loaders.values():
+            loader.cancel()
+        self.prefetch_loaders.clear()
+        self.prefetched.clear()
+        self.folder_states.clear()
+        self.folders = []
+        self.folder_index = None
+        self.session_root = None
+        self.index_token = None
+        if self.loader:
+            self.loader.cancel()
+            self.loader = None
+        self.stop_watching()
+        self.dup_token = None
+        self.meta_token = None
+        self.clear_grid()
+        self.thumb_store.clear()
+        self.folder_var.set("(one folder)")
+        self.folder_menu["menu"].delete(0, "end")
+
+    def start_session(self, root):
+        self.session_root = root
+        self.loading_label.config(text="Indexing folders...")
+        self.index_token = token = object()
+        threading.Thread(target=self.index_folders, args=(token, root), daemon=True).start()
+        self.after(FRAME_MS * 10, self.poll_index, token)
+
+    def index_folders(self, token, root):
+        # Runs off the main thread; the result is picked up by poll_index
+        try:
+            folders = index_tree(root, lambda: token is not self.index_token)
+        except Exception as e:
+            print(f"⚠️ Indexing {root} failed: {e}")
+            folders = []
+        self.index_result = (token, folders)
+
+    def poll_index(self, token):
+        if token is not self.index_token:
+            return
+        if self.index_result is None or self.index_result[0] is not token:
+            self.after(FRAME_MS * 10, self.poll_index, token)
+            return
+        self.folders = self.index_result[1]
+        self.index_result = None
+        self.index_token = None
+        menu = self.folder_menu["menu"]
+        menu.delete(0, "end")
+        for index, (folder, count) in enumerate(self.folders):
+            menu.add_command(label=f"{os.path.relpath(folder, self.session_root)} ({count})",
+                             command=lambda index=index: self.open_folder(index))
+        if not self.folders:
+            self.loading_label.config(text="No images anywhere in that tree.")
+            return
+        self.open_folder(0)
+
+    def step_folder(self, step):
+        if self.folder_index is not None:
+            self.open_folder(self.folder_index + step)
+
+    def open_folder(self, index):
+        if not 0 <= index < len(self.folders) or index == self.folder_index:
+            return
+        self.park_folder()
+        self.folder_index = index
+        self.image_directory = self.folders[index][0]
+        self.folder_var.set(f"{index + 1}/{len(self.folders)}: "
+                            f"{os.path.relpath(self.image_directory, self.session_root)}")
+        state = self.folder_states.pop(self.image_directory, None)
+        if state:
+            self.restore_folder(state)
+        else:
+            self.take_prefetch(self.image_directory)
             self.start_thumbnail_loading()
 
+    def park_folder(self):
+        # Keeps the open folder in memory before another is opened: whole once
+        # its thumbnails are in (it can be reordered from then on), else just
+        # the thumbnails made so far. Duplicate and metadata passes still
+        # running are dropped here and run again on restore.
+        if self.folder_index is None:
+            return
+        if hasattr(self, 'on_disk_order'):
+            self.folder_states[self.image_directory] = FolderState(self.image_data, self.on_disk_order,
+                                                                   self.prefix_entry.get())
+        else:
+            self.prefetched[self.image_directory] = {d.filename: (d.thumb, d.hash, d.stamp)
+                                                     for d in self.image_data if d.thumb is not None}
+        if self.loader:
+            self.loader.cancel()
+            self.loader = None
+        self.stop_watching()
+        self.dup_token = None
+        self.meta_token = None
+        self.pending_order = None
+        self.image_data = []  # the parked list is kept as it is
+        self.clear_grid()
+
+    def restore_folder(self, state):
+        self.image_data = state.image_data
+        self.on_disk_order = state.on_disk_order
+        self.prefix_entry.delete(0, tk.END)
+        self.prefix_entry.insert(0, state.prefix)
+        self.image_files = [d.filename for d in self.image_data]
+        self.total_files = self.loaded_files = len(self.image_data)
+        dupes = sum(1 for d in self.image_data if d.dupes)
+        self.dup_label.config(text=f"⚠️ {dupes} files are exact duplicates (orange)" if dupes else "")
+        note = " — reordered, not renamed yet" if state.reordered() else ""
+        self.loading_label.config(text=f"✅ {self.total_files} thumbnails{note}.")
+        self.redraw_grid()
+        self.start_watching()
+        # It wasn't watched while parked: catch up with the disk
+        try:
+            names = set(list_images(self.image_directory))
+        except OSError:
+            names = set()
+        self.apply_changes(dict.fromkeys(names | set(self.image_files), "changed"))
+        # Both are cached, so a folder that had finished them redoes them quickly
+        self.start_duplicate_check()
+        self.start_metadata()
+        self.start_prefetch()
+
+    def start_prefetch(self):
+        # Thumbnails for the folders likely opened next are made in the
+        # background once the open one has loaded
+        if self.folder_index is None:
+            return
+        wanted = [self.folders[i][0] for i in likely_next(len(self.folders), self.folder_index, PREFETCH_FOLDERS)]
+        wanted = [folder for folder in wanted if folder not in self.folder_states]
+        for folder in list(self.prefetch_loaders):
+            if folder not in wanted:
+                self.take_prefetch(folder)
+        for folder in wanted:
+            if folder in self.prefetch_loaders:
+                continue
+            try:
+                files = list_images(folder)
+            except OSError:
+                continue
+            done = self.prefetched.setdefault(folder, {})
+            missing = [f for f in files if f not in done]
+            if not missing:
+                continue
+            loader = ThumbnailLoader(folder, missing, self.thumb_size, self.thumb_cache, workers=PREFETCH_WORKERS)
+            self.prefetch_loaders[folder] = loader
+            loader.start()
+            self.after(FRAME_MS * 10, self.poll_prefetch, folder, loader)
+
+    def poll_prefetch(self, folder, loader):
+        if self.prefetch_loaders.get(folder) is not loader:
+            return
+        finished = loader.active == 0
+        self.store_prefetched(folder, loader.take_ready())
+        if finished:
+            del self.prefetch_loaders[folder]
+        else:
+            self.after(FRAME_MS * 10, self.poll_prefetch, folder, loader)
+
+    def take_prefetch(self, folder):
+        # Stops prefetching folder, keeping what it has made
+        loader = self.prefetch_loaders.pop(folder, None)
+        if loader:
+            loader.cancel()
+            self.store_prefetched(folder, loader.take_ready())
+
+    def store_prefetched(self, folder, results):
+        done = self.prefetched.setdefault(folder, {})
+        for file, img, img_hash, stamp in results:
+            if img is not None:
+                done[file] = (self.thumb_store.add(img), img_hash, stamp)
+
+    def confirm_discard(self):
+        # Loading a new folder or tree drops reorders not yet renamed
+        pending = [folder for folder, state in self.folder_states.items() if state.reordered()]
+        if hasattr(self, 'on_disk_order') and [d.filename for d in self.image_data] != self.on_disk_order:
+            pending.append(self.image_directory)
+        if not pending:
+            return True
+        return messagebox.askyesno(
+            "Pending Changes",
+            f"You’ve reordered files in {len(pending)} folder(s) but haven’t renamed them.\nDiscard that?"
+        )
+
     def set_on_disk_order(self):
-        self.on_disk_order = [d["filename"] for d in self.image_data]
+        self.on_disk_order = [d.filename for d in self.image_data]
         #print(f"Set ODO to: {self.on_disk_order}")
 
     def on_app_close(self):
         # check for unsaved reordering, if loading is complete
         if hasattr(self, 'on_disk_order'):
-            current_order = [f["filename"] for f in self.image_data]
+            current_order = [f.filename for f in self.image_data]
             #print(f"Current: {current_order}")
             #print(f"On-Disk: {self.on_disk_order}")
             if self.on_disk_order != current_order:
@@ -121,7 +381,26 @@ class DragDropSorter(tk.Tk):
                 )
                 if not confirm:
                     return
+        pending = [folder for folder, state in self.folder_states.items() if state.reordered()]
+        if pending:
+            confirm = messagebox.askyesno(
+                "Pending Changes",
+                f"{len(pending)} other folder(s) were reordered but not renamed.\nExit without saving?"
+            )
+            if not confirm:
+                return
 
+        if self.loader:
+            self.loader.cancel()
+        self.stop_watching()
+        for loader in self.prefetch_loaders.values():
+            loader.cancel()
+        self.dup_token = None
+        self.meta_token = None
+        self.thumb_cache.close()
+        self.thumb_store.close()
+        self.dup_index.close()
+        self.meta_index.close()
         self.destroy()
 
     def on_mousewheel(self, event):
@@ -133,79 +412,458 @@ class DragDropSorter(tk.Tk):
         elif event.num == 5:
             self.canvas.yview_scroll(3, "units")
 
-    def clear_selection_on_background(self, event):
-        widget = self.winfo_containing(event.x_root, event.y_root)
+    def on_canvas_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.refresh_view()
+
+    def on_canvas_press(self, event):
+        index = self.index_at(event)
         # If not one of the image thumbnails, clear selection
-        if widget not in [d["label"] for d in self.image_data]:
-            for lbl in self.selected_widgets:
-                lbl.config(relief="raised", bd=2)
-            self.selected_widgets.clear()
+        if index is None:
+            self.selected.clear()
             self.last_clicked_index = None
+            self.refresh_selection()
+            return
+        self.handle_click_and_drag(event, index)
+
+    def index_at(self, event):
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        if x < 0 or y < 0:
+            return None
+        column = int(x // self.cell_size[0])
+        row = int(y // self.cell_size[1])
+        index = row * self.max_columns + column
+        if column >= self.max_columns or index >= len(self.image_data):
+            return None
+        return index
+
+    def cell_origin(self, index):
+        row, column = divmod(index, self.max_columns)
+        return column * self.cell_size[0], row * self.cell_size[1]
+
+    def visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        first_row = max(0, int(top // self.cell_size[1]) - VIEW_MARGIN_ROWS)
+        last_row = int(bottom // self.cell_size[1]) + VIEW_MARGIN_ROWS
+        return (first_row * self.max_columns,
+                min(len(self.image_data), (last_row + 1) * self.max_columns))
+
+    def update_scrollregion(self):
+        rows = -(-len(self.image_data) // self.max_columns)
+        self.canvas.configure(scrollregion=(0, 0, self.max_columns * self.cell_size[0], rows * self.cell_size[1]))
+
+    def refresh_view(self):
+        # Materialize cells that scrolled into range, drop the ones that left
+        # it along with their Tk images
+        start, end = self.visible_range()
+        for index in [i for i in self.cell_items if not start <= i < end]:
+            for item in self.cell_items.pop(index):
+                self.canvas.delete(item)
+        for index in range(start, end):
+            if index not in self.cell_items:
+                self.draw_cell(index)
+        in_view = set(self.image_data[start:end])
+        for data in self.shown - in_view:
+            data.photo = None
+        self.shown &= in_view
+        # Thumbnails for what is on screen now are generated first
+        if self.loader and (start, end) != self.last_range:
+            self.loader.prioritize([self.image_data[i].filename for i in range(start, end)
+                                    if self.image_data[i].thumb is None])
+        self.last_range = (start, end)
+
+    def draw_cell(self, index):
+        data = self.image_data[index]
+        x, y = self.cell_origin(index)
+        w, h = self.cell_size
+        rect = self.canvas.create_rectangle(x + 4, y + 4, x + w - 4, y + h - 4)
+        image = self.canvas.create_image(x + w // 2, y + h // 2, image=self.photo_for(data))
+        self.cell_items[index] = (rect, image)
+        self.style_cell(index)
+
+    def photo_for(self, data):
+        # The Tk image for an entry in view, made from the store on first use
+        if data.photo is None and data.thumb is not None:
+            data.photo = ImageTk.PhotoImage(self.thumb_store.image(data.thumb))
+            self.shown.add(data)
+        return data.photo
+
+    def style_cell(self, index):
+        rect = self.cell_items[index][0]
+        data = self.image_data[index]
+        if data in self.selected:
+            self.canvas.itemconfig(rect, outline="blue", width=4)
+        elif data.dupes:
+            self.canvas.itemconfig(rect, outline="dark orange", width=4)
+        elif data.similar:
+            self.canvas.itemconfig(rect, outline="green3", width=4)
+        else:
+            self.canvas.itemconfig(rect, outline="gray60", width=2)
+
+    def refresh_selection(self):
+        for index in self.cell_items:
+            self.style_cell(index)
+
+    def clear_grid(self):
+        self.canvas.delete("all")
+        self.cell_items.clear()
+        self.image_data.clear()
+        for data in self.shown:
+            data.photo = None
+        self.shown.clear()
+        self.selected.clear()
+        self.last_clicked_index = None
+        if hasattr(self, 'on_disk_order'):
+            del self.on_disk_order
+        self.update_scrollregion()
+
+    def recover_renames(self):
+        # A rename batch cut short by a crash is finished (or undone) first
+        message = recover(self.image_directory)
+        if message:
+            print(f"📝 {message}")
+            messagebox.showinfo("Rename Recovery", message)
 
     def start_thumbnail_loading(self):
-        self.image_files = [f for f in sorted(os.listdir(self.image_directory))
-                            if f.lower().endswith((".jpg", ".jpeg", ".png"))]
+        if self.loader:
+            self.loader.cancel()
+        self.clear_grid()
+        self.recover_renames()
+        self.image_files = list_images(self.image_directory)
         self.total_files = len(self.image_files)
-        threading.Thread(target=self.load_thumbnails_thread, daemon=True).start()
 
-    def load_thumbnails_thread(self):
-        for idx, file in enumerate(self.image_files):
-            img_path = os.path.join(self.image_directory, file)
-            try:
-                img = Image.open(img_path)
-                img.thumbnail(self.thumb_size, Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-            except Exception:
-                print(f"Failed to open file {file}")
+        # Every file gets its cell up front; thumbnails fill in as they arrive,
+        # except those prefetched while another folder was open
+        self.image_data = [PhotoEntry(file) for file in self.image_files]
+        # The folder wasn't watched while prefetched, so a thumbnail is only
+        # used if its file is unchanged since it was made
+        ready = self.prefetched.pop(self.image_directory, {})
+        for data in self.image_data:
+            if data.filename in ready:
+                thumb, img_hash, stamp = ready[data.filename]
+                if stamp is not None and stamp == file_stamp(os.path.join(self.image_directory, data.filename)):
+                    data.thumb, data.hash, data.stamp = thumb, img_hash, stamp
+        self.loading_entries = {d.filename: d for d in self.image_data if d.thumb is None}
+        self.loaded_files = self.total_files - len(self.loading_entries)
+        self.update_scrollregion()
+
+        self.loader = ThumbnailLoader(self.image_directory, list(self.loading_entries), self.thumb_size,
+                                      self.thumb_cache)
+        self.last_range = None
+        self.refresh_view()
+        self.loader.start()
+        self.after(FRAME_MS, self.poll_thumbnails, self.loader)
+
+        self.start_watching()
+        self.start_duplicate_check()
+
+        self.pending_order = None
+        self.start_metadata()
+
+    def start_metadata(self):
+        self.meta_token = token = object()
+        threading.Thread(target=self.read_metadata, args=(token, self.image_directory, list(self.image_files)),
+                         daemon=True).start()
+        self.after(FRAME_MS, self.poll_metadata, token)
+
+    def start_duplicate_check(self):
+        self.dup_label.config(text="")
+        self.dup_token = token = object()
+        files = [d.filename for d in self.image_data]
+        threading.Thread(target=self.find_duplicates, args=(token, self.image_directory, files),
+                         daemon=True).start()
+        self.after(FRAME_MS, self.poll_duplicates, token)
+
+    def start_watching(self):
+        self.stop_watching()
+        self.watcher = FolderWatcher(self.image_directory, SORTABLE_TYPES, recursive=False)
+        self.watcher.start()
+        self.after(WATCH_MS, self.poll_watch, self.watcher)
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        if self.refresh_loader:
+            self.refresh_loader.cancel()
+            self.refresh_loader = None
+
+    def poll_watch(self, watcher):
+        if watcher is not self.watcher:
+            return
+        if watcher.lost:
+            print(f"⚠️ Lost track of changes in {self.image_directory}; Load again to catch up.")
+            self.stop_watching()
+            return
+        # Changes wait in the watcher until the folder has loaded
+        if not self.loader:
+            changes = watcher.take_changes()
+            if changes:
+                self.apply_changes(changes)
+        self.after(WATCH_MS, self.poll_watch, watcher)
+
+    def apply_changes(self, changes):
+        # Files added, changed or removed behind the grid's back (or renamed
+        # by us, which changes nothing here): the disk says which. New files
+        # go at the end; only new and changed files get new thumbnails.
+        by_name = {d.filename: d for d in self.image_data}
+        removed, redo = [], []
+        for name in changes:
+            stamp = file_stamp(os.path.join(self.image_directory, name))
+            data = by_name.get(name)
+            if stamp is None:
+                if data:
+                    removed.append(data)
+            elif data is None:
+                data = by_name[name] = PhotoEntry(name)
+                self.image_data.append(data)
+                if hasattr(self, 'on_disk_order'):
+                    self.on_disk_order.append(name)
+                redo.append(data)
+            elif data.stamp != stamp or data.thumb is None:
+                redo.append(data)
+        if not removed and not redo:
+            return
+        print(f"📝 {len(removed)} removed, {len(redo)} new or changed in {self.image_directory}")
+        for data in removed:
+            self.forget_entry(data)
+            if hasattr(self, 'on_disk_order') and data.filename in self.on_disk_order:
+                self.on_disk_order.remove(data.filename)
+        for data in redo:
+            data.thumb = data.hash = data.photo = None
+            self.shown.discard(data)
+        self.last_clicked_index = None
+        self.redraw_grid()
+        self.refresh_thumbnails()
+
+    def refresh_thumbnails(self):
+        # (Re)makes thumbnails for every entry without one
+        if self.refresh_loader:
+            self.refresh_loader.cancel()
+        self.refresh_entries = {d.filename: d for d in self.image_data if d.thumb is None}
+        self.refresh_loader = loader = ThumbnailLoader(self.image_directory, list(self.refresh_entries),
+                                                       self.thumb_size, self.thumb_cache)
+        loader.start()
+        self.after(FRAME_MS, self.poll_refreshed, loader)
+
+    def poll_refreshed(self, loader):
+        if loader is not self.refresh_loader:
+            return
+        finished = loader.active == 0
+        failed = False
+        for file, img, img_hash, stamp in loader.take_ready():
+            data = self.refresh_entries.pop(file, None)
+            if data is None:
                 continue
+            path = os.path.join(self.image_directory, file)
+            if img is None:
+                print(f"Failed to open file {file}")
+                self.forget_entry(data)
+                failed = True
+            else:
+                data.thumb = self.thumb_store.add(img)
+                data.hash = img_hash
+                data.stamp = stamp
+                data.meta = self.meta_index.get(path)
+        if failed:
+            self.redraw_grid()
+        else:
+            for index, (_, image) in self.cell_items.items():
+                self.canvas.itemconfig(image, image=self.photo_for(self.image_data[index]))
+        if not finished:
+            self.after(FRAME_MS, self.poll_refreshed, loader)
+            return
+        self.refresh_loader = None
+        # Content changed, so duplicates and similar shots are found again
+        for data in self.image_data:
+            data.similar = None
+        self.group_similar()
+        self.start_duplicate_check()
+
+    def forget_entry(self, data):
+        # Takes an entry out of the grid and out of the groups it was in
+        if data in self.image_data:
+            self.image_data.remove(data)
+        self.selected.discard(data)
+        self.shown.discard(data)
+        for key in ("dupes", "similar"):
+            group = getattr(data, key)
+            if group:
+                group.remove(data)
+                if len(group) == 1:
+                    setattr(group[0], key, None)
+            setattr(data, key, None)
+
+    def read_metadata(self, token, directory, files):
+        # Runs off the main thread; the result is picked up by poll_metadata
+        try:
+            meta = self.meta_index.read_all(directory, files, lambda: token is not self.meta_token)
+        except Exception as e:
+            print(f"⚠️ Reading metadata failed: {e}")
+            meta = {}
+        self.meta_result = (token, meta)
+
+    def poll_metadata(self, token):
+        if token is not self.meta_token:
+            return
+        if self.meta_result is None or self.meta_result[0] is not token:
+            self.after(FRAME_MS * 10, self.poll_metadata, token)
+            return
+        meta = self.meta_result[1]
+        self.meta_result = None
+        self.meta_token = None
+        for data in self.image_data:
+            data.meta = meta.get(data.filename)
+        self.apply_pending_order()
+
+    def order_by(self, how):
+        # Orders the grid from metadata; like a drag, it only takes effect
+        # on disk through Rename & Save Order
+        self.pending_order = how
+        if self.meta_token or self.loader:
+            self.loading_label.config(text=f"{ORDERINGS[how]} order will apply once loading finishes...")
+            return
+        self.apply_pending_order()
+
+    def apply_pending_order(self):
+        if self.pending_order is None or self.meta_token or self.loader or not self.image_data:
+            return
+        how, self.pending_order = self.pending_order, None
+        by_name = {d.filename: d for d in self.image_data}
+        meta = {name: d.meta for name, d in by_name.items()}
+        self.image_data = [by_name[name] for name in order_files(list(by_name), meta, how)]
+        self.last_clicked_index = None
+        self.loading_label.config(text=f"Ordered by {ORDERINGS[how].lower()}. Rename & Save Order to keep it.")
+        self.redraw_grid()
+
+    def find_duplicates(self, token, directory, files):
+        # Runs off the main thread; the result is picked up by poll_duplicates
+        paths = []
+        for file in files:
+            path = os.path.join(directory, file)
             try:
-                self.after(0, self.add_thumbnail_to_grid, file, photo, idx)
-            except Exception:
+                paths.append((path, os.path.getsize(path)))
+            except OSError:
                 pass
-        self.after(0, lambda: self.set_on_disk_order())
-        self.after(0, lambda: self.loading_label.config(text=f"✅ {self.total_files} thumbnails loaded."))
-
-    def add_thumbnail_to_grid(self, file, photo, idx):
-        row = idx // self.max_columns
-        column = idx % self.max_columns
-        lbl = tk.Label(self.frame, image=photo, bd=2, relief="raised")
-        lbl.image = photo
-        lbl.grid(row=row, column=column, padx=5, pady=5)
-
-        lbl.bind("<Button-1>", lambda e, l=lbl, i=idx: self.handle_click_and_drag(e, l, i))
-        lbl.bind("<B1-Motion>", lambda e, l=lbl: self.handle_drag_motion(e, l))
-        lbl.bind("<ButtonRelease-1>", self.finish_drag)
-
-        self.image_data.append({
-            "filename": file,
-            "photo": photo,
-            "label": lbl,
-            "row": row,
-            "column": column
-        })
-        self.loading_label.config(text=f"Loading {len(self.image_data)} of {self.total_files}...")
+        try:
+            groups = self.dup_index.find(paths, lambda: token is not self.dup_token)
+        except Exception as e:
+            print(f"⚠️ Duplicate check failed: {e}")
+            groups = []
+        self.dup_groups = (token, [[os.path.basename(path) for path in group] for group in groups])
+
+    def poll_duplicates(self, token):
+        if token is not self.dup_token:
+            return  # superseded by a newer load
+        if self.dup_groups is None or self.dup_groups[0] is not token:
+            self.after(FRAME_MS * 10, self.poll_duplicates, token)
+            return
+
+        by_name = {d.filename: d for d in self.image_data}
+        for data in self.image_data:
+            data.dupes = None
+        flagged = 0
+        for names in self.dup_groups[1]:
+            group = [by_name[name] for name in names if name in by_name]
+            if len(group) > 1:
+                for data in group:
+                    data.dupes = group
+                flagged += len(group)
+        self.dup_groups = None
+        self.dup_token = None
+        if flagged:
+            self.dup_label.config(text=f"⚠️ {flagged} files are exact duplicates (orange)")
+        self.refresh_selection()
+
+    def poll_thumbnails(self, loader):
+        if loader is not self.loader:
+            return  # superseded by a newer load
+
+        results = loader.take_ready()
+        failed = []
+        for file, img, img_hash, stamp in results:
+            data = self.loading_entries.pop(file)
+            if img is None:
+                print(f"Failed to open file {file}")
+                failed.append(data)
+            else:
+                data.thumb = self.thumb_store.add(img)
+                data.hash = img_hash
+                data.stamp = stamp
+        self.loaded_files += len(results)
+
+        if failed:
+            for data in failed:
+                self.image_data.remove(data)
+            self.redraw_grid()
+        elif results:
+            for index, (_, image) in self.cell_items.items():
+                self.canvas.itemconfig(image, image=self.photo_for(self.image_data[index]))
+
+        if self.loaded_files < self.total_files:
+            self.loading_label.config(text=f"Loading {self.loaded_files} of {self.total_files}...")
+            self.after(FRAME_MS, self.poll_thumbnails, loader)
+            return
+
+        self.loader = None
+        self.set_on_disk_order()
+        self.loading_label.config(text=f"✅ {self.total_files} thumbnails loaded.")
+        self.group_similar()
+        self.apply_pending_order()
+        self.start_prefetch()
+
+    def group_similar(self):
+        entries = {id(d): d for d in self.image_data if d.hash is not None}
+        groups = group_similar({key: d.hash for key, d in entries.items()})
+        for keys in groups:
+            group = [entries[key] for key in keys]
+            for data in group:
+                data.similar = group
+        if groups:
+            count = sum(len(group) for group in groups)
+            self.loading_label.config(text=f"✅ {self.total_files} thumbnails loaded, "
+                                           f"{count} in {len(groups)} groups of similar shots (green).")
+        self.refresh_selection()
+
+    def select_similar(self):
+        # Widen the selection to everything similar to it; with nothing
+        # selected, select all but the first of every group, ready to delete.
+        if self.selected:
+            for data in list(self.selected):
+                self.selected.update(data.similar or ())
+        else:
+            order = {id(d): i for i, d in enumerate(self.image_data)}
+            seen = set()
+            for data in self.image_data:
+                group = data.similar
+                if group and id(group) not in seen:
+                    seen.add(id(group))
+                    self.selected.update(sorted(group, key=lambda d: order[id(d)])[1:])
+        self.last_clicked_index = None
+        self.refresh_selection()
 
     def delete_selected_thumbnails(self, event=None):
-        if not self.selected_widgets:
+        if not self.selected:
             messagebox.showwarning(
                 title="⚠️ Delete",
                 message="Nothing selected!")
 
             return
 
-        to_delete = [d for d in self.image_data if d["label"] in self.selected_widgets]
+        to_delete = [d for d in self.image_data if d in self.selected]
         for data in to_delete:
-            path = os.path.join(self.image_directory, data["filename"])
+            path = os.path.join(self.image_directory, data.filename)
             try:
                 send2trash(path)
                 print(f"🗑️ Deleted {path}")
             except Exception as e:
                 print(f"⚠️ Could not delete {path}: {e}")
                 continue
-            data["label"].destroy()
-            self.image_data.remove(data)
+            self.forget_entry(data)
 
-        self.selected_widgets.clear()
+        self.selected.clear()
         self.last_clicked_index = None
         self.set_on_disk_order()
         self.redraw_grid()
@@ -214,17 +872,18 @@ class DragDropSorter(tk.Tk):
         if getattr(self, "drag_overlay", None):
             return
         
-        count = len(self.selected_widgets)
-        if count == 1:
-            img_data = next((d for d in self.image_data if d["label"] == self.selected_widgets[0]), None)
-            if img_data:
-                self.drag_overlay = tk.Toplevel(self)
-                self.drag_overlay.overrideredirect(True)
-                self.drag_overlay.attributes("-topmost", True)
-                img = img_data["photo"]
-                label = tk.Label(self.drag_overlay, image=img, bd=0)
-                label.pack()
-        elif count > 1:
+        count = len(self.selected)
+        first = next(iter(self.selected), None)
+        if count == 1 and first.thumb is not None:
+            self.drag_overlay = tk.Toplevel(self)
+            self.drag_overlay.overrideredirect(True)
+            self.drag_overlay.attributes("-topmost", True)
+            # Its own Tk image: the cell's may be released if the grid scrolls
+            img = ImageTk.PhotoImage(self.thumb_store.image(first.thumb))
+            label = tk.Label(self.drag_overlay, image=img, bd=0)
+            label.image = img
+            label.pack()
+        elif count > 0:
             self.drag_overlay = tk.Toplevel(self)
             self.drag_overlay.overrideredirect(True)
             self.drag_overlay.attributes("-topmost", True)
@@ -241,90 +900,84 @@ class DragDropSorter(tk.Tk):
             self.drag_overlay.destroy()
             self.drag_overlay = None
 
-    def handle_click_and_drag(self, event, label, index):
+    def handle_click_and_drag(self, event, index):
         if not hasattr(self, 'on_disk_order'):
             return
-        self.dragged_widget = label
-        self.handle_click(event, label, index)
+        self.dragged_index = index
+        self.handle_click(event, index)
 
-    def handle_drag_motion(self, event, label):
-        self.dragged_widget = label  # Prep drag target
+    def handle_drag_motion(self, event):
+        if self.dragged_index is None:
+            return
         self.create_drag_cursor(event)  # Show drag visual
         self.auto_scroll(event)        # Scroll if near edge
         self.move_drag_cursor(event)   # Move overlay
 
-    def handle_click(self, event, label, index):
+    def handle_click(self, event, index):
         ctrl_pressed = (event.state & 0x0004) != 0
         shift_pressed = (event.state & 0x0001) != 0
+        data = self.image_data[index]
 
         if ctrl_pressed:
-            if label in self.selected_widgets:
-                self.selected_widgets.remove(label)
-                label.config(relief="raised", bd=2)
+            if data in self.selected:
+                self.selected.remove(data)
             else:
-                self.selected_widgets.append(label)
-                label.config(relief="solid", bd=4, highlightbackground="blue")
+                self.selected.add(data)
             self.last_clicked_index = index
 
         elif shift_pressed:
             if self.last_clicked_index is not None:
                 i1, i2 = sorted((self.last_clicked_index, index))
-                for i in range(i1, i2 + 1):
-                    lbl = self.image_data[i]["label"]
-                    if lbl not in self.selected_widgets:
-                        self.selected_widgets.append(lbl)
-                        lbl.config(relief="solid", bd=4, highlightbackground="blue")
+                self.selected.update(self.image_data[i1:i2 + 1])
             else:
-                self.selected_widgets = [label]
-                label.config(relief="solid", bd=4, highlightbackground="blue")
+                self.selected = {data}
                 self.last_clicked_index = index
 
         else:
             # If already selected, don’t reset — just prep for drag
-            if label in self.selected_widgets:
-                self.last_clicked_index = index
-            else:
-                for lbl in self.selected_widgets:
-                    lbl.config(relief="raised", bd=2)
-                self.selected_widgets = [label]
-                label.config(relief="solid", bd=4, highlightbackground="blue")
-                self.last_clicked_index = index
+            if data not in self.selected:
+                self.selected = {data}
+            self.last_clicked_index = index
+
+        self.refresh_selection()
 
     def finish_drag(self, event):
-        self.canvas.unbind("<Motion>")
         self.destroy_drag_cursor(event)
-        x = event.x_root - self.frame.winfo_rootx()
-        y = event.y_root - self.frame.winfo_rooty()
-        target = None
-        for data in self.image_data:
-            lbl = data["label"]
-            if lbl == self.dragged_widget:
-                continue
-            if lbl.winfo_x() <= x <= lbl.winfo_x() + lbl.winfo_width() and \
-               lbl.winfo_y() <= y <= lbl.winfo_y() + lbl.winfo_height():
-                target = lbl
-                break
-        if target and self.selected_widgets:
-            group = [d for d in self.image_data if d["label"] in self.selected_widgets]
-            remaining = [d for d in self.image_data if d["label"] not in self.selected_widgets]
-            target_idx = next((i for i, d in enumerate(remaining) if d["label"] == target), len(remaining))
-            self.image_data = remaining[:target_idx] + group + remaining[target_idx:]
-            self.redraw_grid()
+        dragged, self.dragged_index = self.dragged_index, None
+        target_index = self.index_at(event)
+        if target_index is None or target_index == dragged or not self.selected:
+            return
+        target = self.image_data[target_index]
+        if target in self.selected:
+            return
+        # The selection lands, in grid order, just before the target. Only the
+        # span from the first moved cell to the drop point changes.
+        positions = [i for i, d in enumerate(self.image_data) if d in self.selected]
+        lo = min(positions[0], target_index)
+        hi = max(positions[-1], target_index) + 1
+        span = self.image_data[lo:hi]
+        group = [d for d in span if d in self.selected]
+        remaining = [d for d in span if d not in self.selected]
+        at = remaining.index(target)
+        self.image_data[lo:hi] = remaining[:at] + group + remaining[at:]
+        self.last_clicked_index = None
+        self.relayout(lo, hi)
 
-    def set_dragged_widget(self, label):
-        self.dragged_widget = label
-        pass
+    def relayout(self, start, end):
+        # Cells stay where they are; the materialized ones in start..end are
+        # refilled with the entries now at their index
+        for index, (_, image) in self.cell_items.items():
+            if start <= index < end:
+                self.canvas.itemconfig(image, image=self.photo_for(self.image_data[index]))
+                self.style_cell(index)
+        self.refresh_view()  # drops the Tk images of entries moved out of view
 
     def redraw_grid(self):
-        row = column = 0
-        for data in self.image_data:
-            lbl = data["label"]
-            lbl.grid(row=row, column=column, padx=5, pady=5)
-            data["row"], data["column"] = row, column
-            column += 1
-            if column >= self.max_columns:
-                column = 0
-                row += 1
+        # Indices shifted, so rebuild the (few) materialized cells from the model
+        self.canvas.delete("all")
+        self.cell_items.clear()
+        self.update_scrollregion()
+        self.refresh_view()
 
     def preview_order(self):
         prefix = self.prefix_entry.get().strip()
@@ -332,9 +985,9 @@ class DragDropSorter(tk.Tk):
             prefix += "_"
         preview_text = ""
         for idx, data in enumerate(self.image_data, start=1):
-            ext = os.path.splitext(data["filename"])[1].lower()
+            ext = os.path.splitext(data.filename)[1].lower()
             new_name = f"{prefix}{idx:03d}{ext}"
-            preview_text += f"{data['filename']} → {new_name}\n"
+            preview_text += f"{data.filename} → {new_name}\n"
         messagebox.showinfo("Rename Preview", preview_text)
         if messagebox.askyesno("Confirm Rename", "Proceed with renaming these files?"):
             self.save_order()
@@ -343,93 +996,105 @@ class DragDropSorter(tk.Tk):
         prefix = self.prefix_entry.get().strip()
         if prefix and not prefix.endswith("_"):
             prefix += "_"
-        log_entries, temp_names = [], []
-
+        renames = {}
         for idx, data in enumerate(self.image_data, start=1):
-            old_path = os.path.join(self.image_directory, data["filename"])
-            ext = os.path.splitext(data["filename"])[1].lower()
-            temp_name = f"_temp_{idx:03d}{ext}"
-            temp_path = os.path.join(self.image_directory, temp_name)
-            try:
-                os.rename(old_path, temp_path)
-            except Exception as e:
-                print(f"⚠️ Rename failed: {e}")
-                continue
-            data["filename"] = temp_name
-            temp_names.append((temp_path, ext))
-            log_entries.append({"original": os.path.basename(old_path), "temporary": temp_name})
-
-        for idx, (temp_path, ext) in enumerate(temp_names, start=1):
-            final_name = f"{prefix}{idx:03d}{ext}"
-            final_path = os.path.join(self.image_directory, final_name)
-            if os.path.exists(final_path) and os.path.basename(temp_path) != final_name:
-                overwrite = messagebox.askyesno("Conflict Warning",
-                    f"File '{final_name}' already exists.\nOverwrite?")
-                if not overwrite:
-                    continue
-            try:
-                os.rename(temp_path, final_path)
-            except Exception as e:
-                print(f"⚠️ Final rename failed: {e}")
-                continue
-            self.image_data[idx - 1]["filename"] = final_name
-            log_entries[idx - 1]["final"] = final_name
-            
-        self.set_on_disk_order()
-        self.loading_label.config(text=f"File renames complete.")
+            ext = os.path.splitext(data.filename)[1].lower()
+            renames[data.filename] = f"{prefix}{idx:03d}{ext}"
+        if self.apply_renames(renames, prefix):
+            self.set_on_disk_order()
+            self.redraw_grid()
 
-        # Save JSON log
-        timestamp = datetime.datetime.now().isoformat(timespec="seconds").replace(":", "-")
-        log_name = f"rename_log_{timestamp}.json"
-        log_path = os.path.join(self.image_directory, log_name)
+    def apply_renames(self, renames, prefix):
+        # Everything is planned, and every conflict settled, before any file
+        # moves; the batch is journaled and goes into the folder's history.
+        steps, conflicts = plan_renames(self.image_directory, renames)
+        if not steps:
+            self.loading_label.config(text="Files already named that way.")
+            return False
+        if conflicts:
+            shown = "\n".join(conflicts[:10]) + ("\n..." if len(conflicts) > 10 else "")
+            overwrite = messagebox.askyesno("Conflict Warning",
+                f"{len(conflicts)} other file(s) would be overwritten:\n{shown}\nOverwrite?")
+            if not overwrite:
+                return False
+
+        timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+        batch = {
+            "key": f"{timestamp}:{uuid.uuid4().hex}",
+            "timestamp": timestamp,
+            "prefix": prefix,
+            "files": [{"original": old, "final": new} for old, new in renames.items() if old != new]
+        }
         try:
-            with open(log_path, "w") as f:
-                json.dump({
-                    "timestamp": timestamp,
-                    "prefix": prefix,
-                    "files": log_entries
-                }, f, indent=2)
-            print(f"📝 Rename log saved: {log_name}")
-        except Exception as e:
-            print(f"⚠️ Log save failed: {e}")
+            run_renames(self.image_directory, steps, conflicts, batch)
+        except OSError as e:
+            print(f"⚠️ Rename failed: {e}")
+            messagebox.showerror("Rename Failed", f"Renaming stopped and was undone:\n{e}")
+            return False
+        print(f"📝 Renamed {len(batch['files'])} files in {len(steps)} moves")
 
-        self.redraw_grid()
+        # The grid keeps its thumbnails; only the names change
+        for data in self.image_data:
+            data.filename = renames.get(data.filename, data.filename)
+        self.loading_label.config(text=f"File renames complete ({len(steps)} moves).")
+        return True
 
     def restore_from_log(self):
-        logs = [f for f in os.listdir(self.image_directory) if f.startswith("rename_log_") and f.endswith(".json")]
-        if not logs:
-            messagebox.showerror("Restore Error", "No rename logs found.")
+        if not hasattr(self, 'on_disk_order'):
+            messagebox.showerror("Restore Error", "Load a folder (and let it finish loading) first.")
             return
-        logs.sort(reverse=True)
-        log_path = os.path.join(self.image_directory, logs[0])
         try:
-            with open(log_path, "r") as f:
-                log = json.load(f)
-        except Exception:
-            messagebox.showerror("Error", f"Could not read {logs[0]}")
-            return
-        if not messagebox.askyesno("Confirm Restore", f"Restore original filenames from {logs[0]}?"):
+            history = RenameHistory(self.image_directory)
+        except Exception as e:
+            messagebox.showerror("Restore Error", f"Could not open rename history: {e}")
             return
+        try:
+            batches = history.batches()
+            if not batches:
+                messagebox.showerror("Restore Error", "No renames recorded in this folder.")
+                return
+            number = self.choose_batch(batches)
+            if number is None:
+                return
+            names = [d.filename for d in self.image_data]
+            renames = history.names_before(number, names)
+        finally:
+            history.close()
 
-        restored = 0
-        for entry in log.get("files", []):
-            final = os.path.join(self.image_directory, entry.get("final", entry["temporary"]))
-            original = os.path.join(self.image_directory, entry["original"])
-            if os.path.exists(original) and final != original:
-                overwrite = messagebox.askyesno("Conflict Warning",
-                    f"File '{entry['original']}' already exists.\nOverwrite?")
-                if not overwrite:
-                    continue
-            try:
-                os.rename(final, original)
-                restored += 1
-            except Exception as e:
-                print(f"⚠️ Could not restore {entry['final']}: {e}")
-        messagebox.showinfo("Restore Complete", f"Restored {restored} files from {logs[0]}")
-        self.image_data.clear()
-        for widget in self.frame.winfo_children():
-            widget.destroy()
-        self.start_thumbnail_loading()
+        if self.apply_renames(renames, "restore"):
+            # Back in on-disk (name) order, as a fresh load would show it
+            self.image_data.sort(key=lambda d: d.filename)
+            self.selected.clear()
+            self.last_clicked_index = None
+            self.set_on_disk_order()
+            self.redraw_grid()
+
+    def choose_batch(self, batches):
+        # Modal list of earlier renames, newest first; returns the number of
+        # the batch to undo (with everything after it), or None
+        dialog = tk.Toplevel(self)
+        dialog.title("Restore Names")
+        dialog.transient(self)
+        tk.Label(dialog, text="Restore file names to how they were before:").pack(padx=10, pady=5)
+        listbox = tk.Listbox(dialog, width=60, height=min(15, len(batches)))
+        for number, timestamp, prefix, files in batches:
+            listbox.insert(tk.END, f"#{number}  {timestamp}  {prefix or '(no prefix)'}  — {files} files")
+        listbox.selection_set(0)
+        listbox.pack(padx=10, pady=5, fill="both", expand=True)
+        choice = []
+
+        def restore():
+            if listbox.curselection():
+                choice.append(batches[listbox.curselection()[0]][0])
+            dialog.destroy()
+
+        buttons = tk.Frame(dialog)
+        tk.Button(buttons, text="Restore", command=restore).pack(side="left", padx=5)
+        tk.Button(buttons, text="Cancel", command=dialog.destroy).pack(side="left", padx=5)
+        buttons.pack(pady=5)
+        dialog.grab_set()
+        self.wait_window(dialog)
+        return choice[0] if choice else None
 
     def auto_scroll(self, event):
         canvas_height = self.canvas.winfo_height()
@@ -0,0 +1,80 @@
+import os
+import json
+import sqlite3
+
+# Every rename batch made in a folder, oldest first, in one SQLite file in
+# that folder. Batches are only ever appended (a restore is a batch too), so
+# any earlier state can be reached by undoing the newer batches in order.
+
+HISTORY_NAME = ".rename_history.db"
+
+
+class RenameHistory:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.db = sqlite3.connect(os.path.join(directory, HISTORY_NAME))
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                number INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                timestamp TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                files INTEGER NOT NULL
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS moves (
+                batch INTEGER NOT NULL,
+                original TEXT NOT NULL,
+                final TEXT NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS moves_batch ON moves (batch)")
+        self.db.commit()
+        if not self.db.execute("SELECT COUNT(*) FROM batches").fetchone()[0]:
+            self.import_logs()
+
+    def import_logs(self):
+        # rename_log_*.json files from before the history existed
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("rename_log_") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    log = json.load(f)
+                files = [{"original": e["original"], "final": e.get("final") or e["temporary"]}
+                         for e in log.get("files", [])]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Skipped {name}: {e}")
+                continue
+            self.append({"key": f"log:{name}", "timestamp": log.get("timestamp", ""),
+                         "prefix": log.get("prefix", ""), "files": files})
+
+    def append(self, batch):
+        # batch: {"key", "timestamp", "prefix", "files": [{"original", "final"}]}.
+        # key is unique, so recording the same batch twice (as a crash
+        # recovery may) keeps one copy.
+        with self.db:
+            cursor = self.db.execute("INSERT OR IGNORE INTO batches (key, timestamp, prefix, files) "
+                                     "VALUES (?, ?, ?, ?)",
+                                     (batch["key"], batch["timestamp"], batch["prefix"], len(batch["files"])))
+            if cursor.rowcount:
+                self.db.executemany("INSERT INTO moves VALUES (?, ?, ?)",
+                                    [(cursor.lastrowid, e["original"], e["final"]) for e in batch["files"]])
+
+    def batches(self):
+        # [(number, timestamp, prefix, file count)], newest first
+        return self.db.execute("SELECT number, timestamp, prefix, files FROM batches "
+                               "ORDER BY number DESC").fetchall()
+
+    def names_before(self, number, names):
+        # Maps each of names (as they are now) to what it was called before
+        # batch `number` ran, by undoing that batch and every later one.
+        current = {name: name for name in names}
+        for (batch,) in self.db.execute("SELECT number FROM batches WHERE number >= ? ORDER BY number DESC",
+                                        (number,)).fetchall():
+            undo = dict(self.db.execute("SELECT final, original FROM moves WHERE batch=?", (batch,)))
+            current = {now: undo.get(then, then) for now, then in current.items()}
+        return current
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,218 @@
+import os
+import json
+from rename_history import RenameHistory
+
+# Crash-safe batch renames within one folder.
+#
+# plan_renames turns {old name: new name} into the fewest single renames
+# that get there: files already named right are not touched, chains
+# (a -> b, b -> c) run from the end, and only cycles (a -> b, b -> a) go
+# through a temporary name.
+#
+# run_renames writes the whole plan to a journal in the folder before the
+# first rename, then applies it. Each step records the file's size, mtime
+# and inode, which a rename keeps (size and mtime alone match for copies
+# with preserved times, or on coarse-timestamp storage). Steps run strictly
+# in order, so after a crash the last step whose target holds its file
+# marks how far the batch got; recover() finishes the plan from there (roll forward), or if that's
+# no longer possible undoes the steps that were done (rollback).
+
+JOURNAL_NAME = ".rename_journal.json"
+TEMP_PREFIX = "_rename_tmp_"
+BACKUP_PREFIX = "_rename_overwritten_"
+
+
+def fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_dev, st.st_ino]
+
+
+def file_id(path):
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino) if st.st_ino else None
+
+
+def free_name(directory, prefix, ext, taken):
+    n = 1
+    while f"{prefix}{n}{ext}" in taken or os.path.exists(os.path.join(directory, f"{prefix}{n}{ext}")):
+        n += 1
+    name = f"{prefix}{n}{ext}"
+    taken.add(name)
+    return name
+
+
+def plan_renames(directory, renames):
+    # Returns (steps, conflicts): steps is an ordered list of (src, dst)
+    # renames; conflicts are names that would be overwritten though they
+    # aren't part of renames (see run_renames' overwrite).
+    pending = {src: dst for src, dst in renames.items() if src != dst}
+    taken = set(renames) | set(renames.values())
+
+    # On case-insensitive filesystems "A.JPG" is also "a.jpg": a target that
+    # is really one of the sources waits for that source to move.
+    ids = {}
+    for src in pending:
+        try:
+            key = file_id(os.path.join(directory, src))
+        except OSError:
+            continue
+        if key:
+            ids[key] = src
+    holder = {}
+    conflicts = []
+    for dst in pending.values():
+        if dst in pending or not os.path.exists(os.path.join(directory, dst)):
+            holder[dst] = dst
+            continue
+        src = ids.get(file_id(os.path.join(directory, dst)))
+        if src is None:
+            conflicts.append(dst)
+        holder[dst] = src
+
+    waiting_on = {}  # source name -> the move into it, which waits for it to go
+    waits_for = {}  # and back
+    for src, dst in pending.items():
+        if holder[dst] in pending:
+            waiting_on[holder[dst]] = src
+            waits_for[src] = holder[dst]
+    ready = [src for src, dst in pending.items() if holder[dst] not in pending]
+
+    steps = []
+    while pending:
+        if not ready:
+            # Only cycles are left: park one file under a temporary name. A
+            # file only changing case is a cycle of one, waiting on itself.
+            src = next(iter(pending))
+            temp = free_name(directory, TEMP_PREFIX, os.path.splitext(src)[1], taken)
+            pending[temp] = pending.pop(src)
+            steps.append((src, temp))
+            held = waits_for.pop(src)
+            waiting_on[held] = temp
+            waits_for[temp] = held
+            ready.append(waiting_on.pop(src))
+            continue
+        src = ready.pop()
+        steps.append((src, pending.pop(src)))
+        if src in waiting_on:
+            ready.append(waiting_on.pop(src))
+    return steps, conflicts
+
+
+def write_journal(directory, journal):
+    path = os.path.join(directory, JOURNAL_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(journal, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def run_renames(directory, steps, overwrite=(), batch=None):
+    # Applies planned steps. Files named in overwrite are first moved aside
+    # and only deleted once every rename is done. batch (see RenameHistory
+    # .append) is added to the folder's history at the end, so it is
+    # recorded exactly when the renames happened. Raises OSError after
+    # rolling back if a step fails.
+    taken = set()
+    aside = [(name, free_name(directory, BACKUP_PREFIX, os.path.splitext(name)[1], taken))
+             for name in overwrite]
+    # What each name will hold when its step runs: temporary names take on
+    # the fingerprint of the file parked there
+    stamps = {}
+    journal_steps = []
+    for src, dst in aside + list(steps):
+        if src not in stamps:
+            stamps[src] = fingerprint(os.path.join(directory, src))
+        stamps[dst] = stamps.pop(src)
+        journal_steps.append([src, dst, stamps[dst]])
+    journal = {
+        "steps": journal_steps,
+        "discard": [backup for _, backup in aside],
+        "batch": batch,
+    }
+    write_journal(directory, journal)
+    roll_forward(directory, journal)
+
+
+def step_done(directory, step):
+    src, dst, stamp = step
+    try:
+        # Journals from before inodes were recorded hold size and mtime only
+        return fingerprint(os.path.join(directory, dst))[:len(stamp)] == stamp
+    except OSError:
+        return False
+
+
+def steps_done(directory, steps):
+    # An earlier step's target may since have been renamed again, so look
+    # for the last step that visibly happened
+    for i in range(len(steps) - 1, -1, -1):
+        if step_done(directory, steps[i]):
+            return i + 1
+    return 0
+
+
+def roll_forward(directory, journal, done=0):
+    steps = journal["steps"]
+    try:
+        for src, dst, stamp in steps[done:]:
+            if os.path.exists(os.path.join(directory, dst)):
+                raise FileExistsError(f"{dst} is in the way")
+            os.rename(os.path.join(directory, src), os.path.join(directory, dst))
+            done += 1
+    except OSError:
+        roll_back(directory, journal, done)
+        raise
+
+    for name in journal["discard"]:
+        try:
+            if os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+        except OSError as e:
+            print(f"⚠️ Could not remove {name}: {e}")
+    if journal["batch"]:
+        history = RenameHistory(directory)
+        try:
+            history.append(journal["batch"])
+        finally:
+            history.close()
+    os.remove(os.path.join(directory, JOURNAL_NAME))
+
+
+def roll_back(directory, journal, done):
+    # Undo the first `done` steps in reverse order. If one can't be undone
+    # it stops there and keeps the journal, so nothing is lost and
+    # recovery can be retried.
+    for step in reversed(journal["steps"][:done]):
+        src, dst, stamp = step
+        try:
+            if not step_done(directory, step):
+                raise FileNotFoundError(f"{dst} is missing or changed")
+            if os.path.exists(os.path.join(directory, src)):
+                raise FileExistsError(f"{src} is in the way")
+            os.rename(os.path.join(directory, dst), os.path.join(directory, src))
+        except OSError as e:
+            print(f"⚠️ Rollback stopped at {dst} -> {src}: {e}")
+            return False
+    os.remove(os.path.join(directory, JOURNAL_NAME))
+    return True
+
+
+def recover(directory):
+    # Finishes or undoes a batch interrupted by a crash. Returns a message
+    # for the user, or None when there was nothing to recover.
+    path = os.path.join(directory, JOURNAL_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            journal = json.load(f)
+    except (OSError, ValueError) as e:
+        return f"Unreadable rename journal {JOURNAL_NAME}: {e}"
+    try:
+        roll_forward(directory, journal, steps_done(directory, journal["steps"]))
+        return "Finished renames interrupted last time."
+    except OSError as e:
+        if os.path.exists(path):
+            return f"Could not finish or undo interrupted renames ({e}); see {JOURNAL_NAME}."
+        return f"Undid renames interrupted last time ({e})."
@@ -1,13 +1,24 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, scrolledtext
 import os
+import sys
 import json
-import time
 import threading
-from PIL import Image
+import multiprocessing
+from collections import deque
+import resize_core
+from resize_core import ResizeEngine
+from output_profiles import load_profiles
+from fs_watch import FolderWatcher, POLL_SECONDS, POLL_SECONDS_PER_FILE
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, scrolledtext
+except ImportError:
+    tk = None  # headless host: command-line runs only (see resize_core.main)
 
 CONFIG_FILE = "photo_resizer_settings.json"
-PHOTO_TYPES = ('.jpg', '.jpeg', '.tiff', '.png')
+MAX_LOG_LINES = 5000
+LOG_INTERVAL_MS = 100
+WATCH_INTERVAL_MS = 1000
+
 
 class PhotoResizerApp:
     def __init__(self, root):
@@ -18,15 +29,38 @@ class PhotoResizerApp:
         self.src_path = tk.StringVar()
         self.dst_path = tk.StringVar()
         self.test_mode = tk.BooleanVar()
+        self.workers = tk.IntVar(value=os.cpu_count() or 1)
+        self.draft_mode = tk.BooleanVar(value=True)
+        self.incremental = tk.BooleanVar(value=True)
+        self.timing = tk.BooleanVar()
+        self.memory_budget = tk.IntVar(value=0)  # MB, 0 = no limit
+        self.dedupe = tk.BooleanVar()
+        self.output_profiles = tk.StringVar()  # presets or a JSON file; blank = one 1080 JPEG
         self.going = False
+        self.engine = None
+        self.scan_engine = None
         self.source_list = []
-
+        self.probes = {}
+        self.duplicates = {}
         self.total_input_size = 0
-        self.total_output_size = 0
-        self.processed = 0
+        # After a scan the source tree is watched: changes update source_list
+        # through source_engine (the engine that scanned it), and the files
+        # to redo collect in changed. last_run holds the settings of the last
+        # finished run; another run with the same settings only does changed.
+        self.watcher = None
+        self.source_engine = None
+        self.changed = set()
+        self.last_run = None
+
+        # Filled from worker threads, drained by the Tk main loop in drain_log.
+        # Bounded like the text widget, so a burst can't queue more than it shows.
+        self.pending_log = deque(maxlen=MAX_LOG_LINES)
+        self.ui_calls = deque()
 
         self.setup_ui()
         self.load_config()
+        self.root.after(LOG_INTERVAL_MS, self.drain_log)
+        self.root.after(WATCH_INTERVAL_MS, self.poll_watch)
 
     def setup_ui(self):
         frame = ttk.Frame(self.root)
@@ -40,7 +74,27 @@ class PhotoResizerApp:
         ttk.Entry(frame, textvariable=self.dst_path, width=50).grid(row=1, column=1)
         ttk.Button(frame, text="Browse", command=self.select_dst).grid(row=1, column=2)
 
-        ttk.Checkbutton(frame, text="Test Mode", variable=self.test_mode).grid(row=2, column=1, sticky='w')
+        # One control per cell: the middle column holds packed rows of them
+        options_frame = ttk.Frame(frame)
+        options_frame.grid(row=2, column=1, sticky='w')
+        ttk.Checkbutton(options_frame, text="Test Mode", variable=self.test_mode).pack(side='left')
+        ttk.Checkbutton(options_frame, text="Fast JPEG Decode", variable=self.draft_mode).pack(side='left', padx=(8, 0))
+        ttk.Checkbutton(options_frame, text="Timing Report", variable=self.timing).pack(side='left', padx=(8, 0))
+        ttk.Checkbutton(options_frame, text="Link Duplicates", variable=self.dedupe).pack(side='left', padx=(8, 0))
+        ttk.Checkbutton(frame, text="Incremental", variable=self.incremental).grid(row=2, column=2, sticky='w')
+
+        limits_frame = ttk.Frame(frame)
+        limits_frame.grid(row=3, column=1, sticky='w')
+        ttk.Label(limits_frame, text="Workers:").pack(side='left')
+        ttk.Spinbox(limits_frame, from_=1, to=64, width=4, textvariable=self.workers).pack(side='left')
+        ttk.Label(limits_frame, text="Memory MB:").pack(side='left', padx=(8, 0))
+        ttk.Spinbox(limits_frame, from_=0, to=65536, increment=256, width=6,
+                    textvariable=self.memory_budget).pack(side='left')
+
+        profiles_frame = ttk.Frame(frame)
+        profiles_frame.grid(row=4, column=1, sticky='w')
+        ttk.Label(profiles_frame, text="Outputs:").pack(side='left')
+        ttk.Entry(profiles_frame, textvariable=self.output_profiles, width=20).pack(side='left')
 
         self.scan_btn = ttk.Button(frame, text="Scan", command=self.scan)
         self.scan_btn.grid(row=3, column=0, pady=5)
@@ -64,11 +118,30 @@ class PhotoResizerApp:
             self.save_config()
 
     def log_message(self, message):
-        self.log.config(state='normal')
-        self.log.insert(tk.END, message + '\n')
-        self.log.see(tk.END)
-        self.log.config(state='disabled')
-        self.root.update_idletasks()
+        # Safe from any thread; the text widget is only touched in drain_log
+        self.pending_log.append(message)
+
+    def run_on_ui(self, func):
+        self.ui_calls.append(func)
+
+    def drain_log(self):
+        while self.ui_calls:
+            self.ui_calls.popleft()()
+
+        lines = []
+        while self.pending_log:
+            lines.append(self.pending_log.popleft())
+        if lines:
+            self.log.config(state='normal')
+            self.log.insert(tk.END, '\n'.join(lines) + '\n')
+            # Keep only the newest MAX_LOG_LINES lines
+            excess = int(self.log.index('end-1c').split('.')[0]) - 1 - MAX_LOG_LINES
+            if excess > 0:
+                self.log.delete('1.0', f'{excess + 1}.0')
+            self.log.see(tk.END)
+            self.log.config(state='disabled')
+
+        self.root.after(LOG_INTERVAL_MS, self.drain_log)
 
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
@@ -76,100 +149,241 @@ class PhotoResizerApp:
                 cfg = json.load(f)
                 self.src_path.set(cfg.get("source", ""))
                 self.dst_path.set(cfg.get("destination", ""))
+                self.workers.set(cfg.get("workers", os.cpu_count() or 1))
+                self.draft_mode.set(cfg.get("draft", True))
+                self.incremental.set(cfg.get("incremental", True))
+                self.timing.set(cfg.get("timing", False))
+                self.memory_budget.set(cfg.get("memory_budget", 0))
+                self.dedupe.set(cfg.get("dedupe", False))
+                self.output_profiles.set(cfg.get("profiles", ""))
 
     def save_config(self):
         with open(CONFIG_FILE, 'w') as f:
             json.dump({
                 "source": self.src_path.get(),
-                "destination": self.dst_path.get()
+                "destination": self.dst_path.get(),
+                "workers": self.get_workers(),
+                "draft": self.draft_mode.get(),
+                "incremental": self.incremental.get(),
+                "timing": self.timing.get(),
+                "memory_budget": self.get_memory_budget(),
+                "dedupe": self.dedupe.get(),
+                "profiles": self.output_profiles.get()
             }, f)
 
+    def get_workers(self):
+        try:
+            return max(1, self.workers.get())
+        except tk.TclError:
+            return os.cpu_count() or 1
+
+    def get_memory_budget(self):
+        try:
+            return max(0, self.memory_budget.get())
+        except tk.TclError:
+            return 0
+
+    def get_profiles(self):
+        spec = self.output_profiles.get().strip()
+        if not spec:
+            return None
+        try:
+            return load_profiles(spec)
+        except (OSError, ValueError) as e:
+            self.log_message(f"Error: outputs — {e}; using the default 1080 JPEG")
+            return None
+
+    def make_engine(self, **kwargs):
+        return ResizeEngine(self.src_path.get(), self.dst_path.get(), workers=self.get_workers(),
+                            test=self.test_mode.get(), draft=self.draft_mode.get(),
+                            incremental=self.incremental.get(), timing=self.timing.get(),
+                            memory_budget=self.get_memory_budget() * 1024 * 1024 or None,
+                            dedupe=self.dedupe.get(), profiles=self.get_profiles(),
+                            report=self.on_engine_event, **kwargs)
+
     def scan(self):
-        source_dir = self.src_path.get()
-        if not os.path.isdir(source_dir):
-            self.log_message("Invalid source directory.")
+        if self.scan_engine:
+            self.scan_engine.stop()
+            self.log_message("Cancel requested...")
             return
 
-        self.log_message("Scanning for image files...")
-        self.source_list.clear()
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        self.source_engine = None
+        self.changed.clear()
+        self.last_run = None
+
+        # source_list is shared with the engine, so it fills in as the scan runs.
+        # In test mode the scan also reads each header, so dry runs need no more I/O.
+        self.scan_engine = self.make_engine(probe=self.test_mode.get())
+        self.source_list = self.scan_engine.source_list
+        self.probes = self.scan_engine.probes
+        self.duplicates = self.scan_engine.duplicates
         self.total_input_size = 0
-
-        for root_dir, _, files in os.walk(source_dir):
-            for file in files:
-                if file.lower().endswith(PHOTO_TYPES):
-                    full_path = os.path.join(root_dir, file)
-                    rel_path = os.path.relpath(full_path, source_dir)
-                    self.source_list.append(rel_path)
-                    self.total_input_size += os.path.getsize(full_path)
-
-        mb = self.total_input_size / (1024 * 1024)
-        self.log_message(f"Found {len(self.source_list)} image(s). Total size: {mb:.2f} MB")
+        self.scan_btn.config(text="Cancel")
+        self.go_btn.config(state='disabled')
+        threading.Thread(target=self.scan_thread, args=(self.scan_engine,), daemon=True).start()
+
+    def scan_thread(self, engine):
+        complete = engine.scan()
+        self.total_input_size = engine.total_input_size
+        self.run_on_ui(lambda: self.scan_finished(engine, complete))
+
+    def scan_finished(self, engine, complete):
+        self.scan_engine = None
+        self.scan_btn.config(text="Scan")
+        self.go_btn.config(state='normal')
+        if complete:
+            self.source_engine = engine
+            self.watcher = FolderWatcher(engine.src_root, resize_core.PHOTO_TYPES)
+            self.watcher.start()
+            if self.watcher.mode == "polling":
+                every = max(POLL_SECONDS, len(engine.source_list) * POLL_SECONDS_PER_FILE)
+                self.log_message(f"Watching the source for changes by polling (no inotify here): the tree is "
+                                 f"re-listed every {every:.0f}s or so.")
+            else:
+                self.log_message(f"Watching the source for changes ({self.watcher.mode}).")
+
+    def poll_watch(self):
+        # Changes are taken between runs only: source_list is the running
+        # engine's while it works
+        if self.watcher and not self.going and not self.scan_engine:
+            if self.watcher.lost:
+                self.log_message("Lost track of changes in the source; scan again to catch up.")
+                self.watcher.stop()
+                self.watcher = None
+            else:
+                changes = self.watcher.take_changes()
+                if changes:
+                    redo, removed = self.source_engine.apply_changes(changes)
+                    self.changed.update(redo)
+                    self.changed.difference_update(removed)
+                    self.total_input_size = self.source_engine.total_input_size
+        self.root.after(WATCH_INTERVAL_MS, self.poll_watch)
+
+    def run_settings(self):
+        # What a run's output depends on, besides the source files
+        return (self.dst_path.get(), self.draft_mode.get(), self.output_profiles.get().strip(),
+                self.dedupe.get())
 
     def toggle_processing(self):
         if not self.going:
+            if not self.source_list:
+                self.log_message("No files to process. Please scan first.")
+                return
+            # Straight after a finished run, only what the watcher saw change
+            rel_paths = None
+            settings = self.run_settings()
+            if settings == self.last_run and self.incremental.get() and not self.test_mode.get():
+                if not self.changed:
+                    self.log_message("Nothing has changed since the last run.")
+                    return
+                rel_paths = sorted(self.changed)
+                self.log_message(f"Redoing {len(rel_paths)} changed file(s)...")
             self.going = True
             self.go_btn.config(text="Stop")
-            threading.Thread(target=self.process_images, daemon=True).start()
+            self.save_config()
+            # Built here so the Tk variables are only read on the main thread
+            # Duplicates found by the last scan; none if the box was unticked since
+            self.engine = self.make_engine(probes=self.probes,
+                                           duplicates=self.duplicates if self.dedupe.get() else {})
+            self.engine.source_list = self.source_list
+            self.engine.total_input_size = self.total_input_size
+            threading.Thread(target=self.process_images, args=(self.engine, rel_paths, settings),
+                             daemon=True).start()
         else:
             self.going = False
+            if self.engine:
+                self.engine.stop()
             self.log_message("Stop requested...")
 
-    def process_images(self):
-        if not self.source_list:
-            self.log_message("No files to process. Please scan first.")
-            self.going = False
-            self.go_btn.config(text="Go")
-            return
-
-        self.total_output_size = 0
-        self.processed = 0
-        test = self.test_mode.get()
-        src_root = self.src_path.get()
-        dst_root = self.dst_path.get()
-        last_log = time.time()
-
-        for rel_path in self.source_list:
-            if not self.going:
-                break
-
-            try:
-                src_file = os.path.join(src_root, rel_path)
-                with Image.open(src_file) as img:
-                    w, h = img.size
-                    if w > h:
-                        new_h = 1080
-                        new_w = int(w * (1080 / h))
-                    else:
-                        new_w = 1080
-                        new_h = int(h * (1080 / w))
-
-                    self.log_message(f"{rel_path}: {w}x{h} -> {new_w}x{new_h}")
-
-                    if not test:
-                        resized = img.resize((new_w, new_h), Image.LANCZOS)
-                        dest_file = os.path.join(dst_root, rel_path)
-                        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
-                        resized.save(dest_file, "JPEG", quality=95)
-                        self.total_output_size += os.path.getsize(dest_file)
-
-                    self.processed += 1
-
-                    if time.time() - last_log > 1:
-                        self.log_message(f"Processed {self.processed} file(s)...")
-                        last_log = time.time()
-
-            except Exception as e:
-                self.log_message(f"Error: {rel_path} — {e}")
-
-        self.log_message("Processing complete." if self.going else "Processing stopped.")
-        self.log_message(f"Files processed: {self.processed}")
-        self.log_message(f"Total input: {self.total_input_size / (1024*1024):.2f} MB")
-        if not test:
-            self.log_message(f"Total output: {self.total_output_size / (1024*1024):.2f} MB")
+    def process_images(self, engine, rel_paths, settings):
+        summary = engine.run(rel_paths)
+        self.run_on_ui(lambda: self.processing_finished(summary, settings))
 
+    def processing_finished(self, summary, settings):
+        if not summary["stopped"] and not summary["test"] and not summary["errors"]:
+            self.last_run = settings
+            self.changed.clear()
+        self.engine = None
         self.going = False
         self.go_btn.config(text="Go")
-        
+
+    def on_engine_event(self, event):
+        kind = event["event"]
+        if kind == "error":
+            self.log_message(f"Error: {event['message']}")
+        elif kind == "scan_start":
+            self.log_message("Scanning for image files...")
+        elif kind == "scan_progress":
+            mb = event["input_bytes"] / (1024 * 1024)
+            self.log_message(f"Scanning... {event['files']} image(s), {mb:.2f} MB so far")
+        elif kind == "scan":
+            mb = event["input_bytes"] / (1024 * 1024)
+            if event["cancelled"]:
+                self.log_message("Scan cancelled.")
+            self.log_message(f"Found {event['files']} image(s). Total size: {mb:.2f} MB")
+        elif kind == "dedupe_start":
+            self.log_message(f"Checking {event['files']} file(s) for duplicates...")
+        elif kind == "duplicates":
+            mb = event["bytes"] / (1024 * 1024)
+            self.log_message(f"Found {event['copies']} duplicate(s) in {event['groups']} group(s), {mb:.2f} MB")
+        elif kind == "changes":
+            mb = event["input_bytes"] / (1024 * 1024)
+            self.log_message(f"Source changed: {event['added']} added, {event['modified']} modified, "
+                             f"{event['removed']} removed; now {event['files']} image(s), {mb:.2f} MB")
+        elif kind == "manifest":
+            self.log_message(f"Manifest has {event['entries']} file(s) from earlier runs.")
+        elif kind == "start":
+            self.log_message(f"Processing with {event['workers']} worker(s)...")
+            if len(event["profiles"]) > 1:
+                self.log_message(f"Outputs: {', '.join(event['profiles'])}")
+            if event["memory_budget"]:
+                self.log_message(f"Memory budget {event['memory_budget'] // (1024*1024)} MB, "
+                                 f"{event['image_limit'] // (1024*1024)} MB per image")
+        elif kind == "file":
+            if event["status"] == "error":
+                self.log_message(f"Error: {event['rel_path']} — {event['error']}")
+            elif event["status"] == "done":
+                (w, h), (new_w, new_h) = event["size"], event["new_size"]
+                note = " (strip-wise)" if event["banded"] else ""
+                if len(event["renditions"]) > 1:
+                    new_sizes = ", ".join(f"{nw}x{nh}" for nw, nh in (r["size"] for r in event["renditions"]))
+                else:
+                    new_sizes = f"{new_w}x{new_h}"
+                self.log_message(f"{event['rel_path']}: {w}x{h} -> {new_sizes}{note}")
+            elif event["status"] == "duplicate":
+                self.log_message(f"{event['rel_path']}: same as {event['duplicate_of']}")
+        elif kind == "progress":
+            self.log_message(f"Processed {event['processed']} file(s)...")
+        elif kind == "timing_report":
+            self.log_message(f"Timing: {event['files']} file(s), {event['files_per_sec']} files/s, "
+                             f"{event['input_mb_per_sec']} MB/s")
+            for stage, stats in event["stages"].items():
+                self.log_message(f"  {stage}: mean {stats['mean_ms']} ms, p90 {stats['p90_ms']} ms, "
+                                 f"max {stats['max_ms']} ms, total {stats['total_s']} s")
+            if event["slowest"]:
+                self.log_message("  Slowest files:")
+                for row in event["slowest"]:
+                    self.log_message(f"    {row['rel_path']}: {row['total_ms']} ms")
+            if "json_report" in event:
+                self.log_message(f"  Report saved: {event['json_report']}")
+        elif kind == "done":
+            self.log_message("Processing stopped." if event["stopped"] else "Processing complete.")
+            self.log_message(f"Files processed: {event['processed']}")
+            if event["skipped"]:
+                self.log_message(f"Files skipped (unchanged): {event['skipped']}")
+            if event["duplicates"]:
+                self.log_message(f"Duplicates linked: {event['duplicates']}")
+            if event["methods"]:
+                self.log_message("Methods: " + ", ".join(f"{m} {n}" for m, n in event["methods"].items()))
+            self.log_message(f"Total input: {event['input_bytes'] / (1024*1024):.2f} MB")
+            if not event["test"]:
+                self.log_message(f"Total output: {event['output_bytes'] / (1024*1024):.2f} MB")
+            else:
+                self.log_message(f"Estimated output: {event['estimated_output_bytes'] / (1024*1024):.2f} MB")
+
     def auto_scroll(self, event):
         SCROLL_MARGIN = 30
         SCROLL_SPEED = 3
@@ -181,6 +395,12 @@ class PhotoResizerApp:
             self.canvas.yview_scroll(SCROLL_SPEED, "units")
         
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    # Any arguments mean a headless run: python resize.py --src ... --dst ...
+    if len(sys.argv) > 1:
+        sys.exit(resize_core.main())
+    if tk is None:
+        sys.exit("tkinter is not available; run headless with: python resize.py --src SRC --dst DST")
     root = tk.Tk()
     app = PhotoResizerApp(root)
     root.mainloop()
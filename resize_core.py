@@ -0,0 +1,898 @@
+import io
+import os
+import sys
+import json
+import hashlib
+import shutil
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image
+from resize_manifest import ResizeManifest
+from stage_timing import StageTimings
+from image_probe import probe_image
+from dup_index import DuplicateIndex, INDEX_NAME
+from fs_watch import file_stamp
+from fast_path import plan_methods, copy_bytes, METHODS
+from output_profiles import (default_profiles, load_profiles, profile_key, output_path, encode,
+                             BYTES_PER_PIXEL, PRESETS)
+
+# GUI-independent resize engine, shared by the Tk app in resize.py and the
+# command line (python resize.py --src ... / python resize_core.py --src ...).
+
+PHOTO_TYPES = ('.jpg', '.jpeg', '.tiff', '.png')
+TARGET_SIZE = 1080
+SCAN_THREADS = 8
+READ_THREADS = 4
+WRITE_THREADS = 2
+# Memory-budget mode: files over the per-image limit are passed to workers by
+# path rather than as bytes, and plain uncompressed rows are decoded strip-wise
+# in bands of about BAND_BYTES.
+BAND_BYTES = 32 * 1024 * 1024
+REDUCING_GAP = 3.0
+# Bytes per pixel of the raw (undecoded) row formats strip-wise decoding handles
+RAW_PIXEL_BYTES = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4, "RGBX": 4, "CMYK": 4, "I;16": 2, "I;16B": 2,
+                   "RGB;16L": 6, "RGB;16B": 6, "RGBA;16L": 8, "RGBA;16B": 8}
+
+
+def target_size(w, h, target=TARGET_SIZE):
+    if w > h:
+        return int(w * (target / h)), target
+    return target, int(h * (target / w))
+
+
+# Everything that changes the bytes written for a file; a manifest entry
+# recorded with different params is treated as out of date.
+def output_params(draft, profiles=None):
+    keys = "+".join(profile_key(profile) for profile in profiles or default_profiles())
+    return f"{keys}:draft={int(draft)}"
+
+
+# Output sizes for each profile, in profile order. A source already at or
+# below a profile's short edge keeps its size unless the profile upscales.
+def rendition_sizes(w, h, profiles):
+    return [(w, h) if not profile["upscale"] and min(w, h) <= profile["target"]
+            else target_size(w, h, profile["target"]) for profile in profiles]
+
+
+def estimated_bytes(sizes, profiles):
+    return int(sum(new_w * new_h * BYTES_PER_PIXEL[profile["format"]]
+                   for (new_w, new_h), profile in zip(sizes, profiles)))
+
+
+def unchanged(previous, st, params, dest_files):
+    return (previous is not None and previous["params"] == params
+            and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns
+            and all(os.path.exists(dest_file) for dest_file in dest_files))
+
+
+# Lists one directory level. scandir's d_type tells files from directories
+# without a stat call, and on Windows the size comes from the listing too.
+# With probe, each image's header is read as well (see image_probe).
+def scan_dir(path, probe=False):
+    files, subdirs = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(PHOTO_TYPES) and entry.is_file():
+                    files.append((entry.path, entry.stat().st_size, probe_image(entry.path) if probe else None))
+            except OSError:
+                pass
+    return files, subdirs
+
+
+def new_result(rel_path):
+    return {"rel_path": rel_path, "size": None, "new_size": None, "output_bytes": 0, "error": None,
+            "skipped": False, "file_size": None, "mtime_ns": None, "hash": None, "timings": {},
+            "orientation": None, "estimated_bytes": 0, "memory": 0, "banded": False, "renditions": []}
+
+
+# Read stage (I/O thread): the only place the source file is read. Applies
+# the manifest check (previous is the file's entry in incremental mode,
+# else None) and returns what the resize stage should decode, or None when
+# result is already final. Test mode only needs the header: it is answered
+# here from probes (rel_path -> probe_image info, filled by the scan or on
+# first use), and only headers the probe can't parse go on to PIL.
+# Files larger than stream_over are hashed in chunks and handed on by path.
+def read_source(src_root, dst_root, rel_path, test, params, previous, result, probes=None,
+                profiles=None, stream_over=None, draft=True):
+    profiles = profiles or default_profiles()
+    src_file = os.path.join(src_root, rel_path)
+    if test:
+        info = probes.get(rel_path) if probes is not None else None
+        if info is None:
+            info = probe_image(src_file)
+            if info is None:
+                return src_file
+            if probes is not None:
+                probes[rel_path] = info
+        w, h = info["width"], info["height"]
+        sizes = rendition_sizes(w, h, profiles)
+        methods = plan_methods(info["format"], w, h, sizes, profiles, draft)
+        result["size"], result["new_size"] = (w, h), sizes[0]
+        result["renditions"] = [{"path": output_path(rel_path, profile), "size": size, "method": method}
+                                for profile, size, method in zip(profiles, sizes, methods)]
+        result["orientation"] = info["orientation"]
+        result["estimated_bytes"] = estimated_bytes(sizes, profiles)
+        return None
+
+    dest_files = [os.path.join(dst_root, output_path(rel_path, profile)) for profile in profiles]
+    st = os.stat(src_file)
+    result["file_size"], result["mtime_ns"] = st.st_size, st.st_mtime_ns
+    if unchanged(previous, st, params, dest_files):
+        result["skipped"] = True
+        result["hash"] = previous["hash"]
+        result["output_bytes"] = previous["output_bytes"]
+        return None
+
+    if stream_over is not None and st.st_size > stream_over:
+        digest = hashlib.sha1()
+        with open(src_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        data = src_file
+    else:
+        with open(src_file, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data)
+    result["hash"] = digest.hexdigest()
+    # Touched or re-copied but identical content: nothing to redo
+    if (previous is not None and previous["params"] == params
+            and previous["hash"] == result["hash"] and all(os.path.exists(f) for f in dest_files)):
+        result["skipped"] = True
+        result["output_bytes"] = previous["output_bytes"]
+        return None
+    return data
+
+
+# Pillow keeps 1-bit, greyscale and palette images at a byte per pixel,
+# 16-bit greyscale at two and everything else padded to four.
+def pixel_bytes(mode):
+    if mode in ("1", "L", "P"):
+        return 1
+    return 2 if mode.startswith("I;16") else 4
+
+
+def reduce_factor(w, h, new_w, new_h):
+    return max(1, int(min(w / new_w, h / new_h) / REDUCING_GAP))
+
+
+# Row size in bytes of an image stored as one block of uncompressed,
+# top-down rows (a plain TIFF), or None when its decoder can only start at
+# the top of the image (PNG, compressed TIFF, JPEG).
+def raw_row_bytes(img):
+    if len(img.tile) != 1:
+        return None
+    codec, extents, offset, args = img.tile[0]
+    if codec != "raw" or tuple(extents) != (0, 0) + img.size:
+        return None
+    if isinstance(args, str):
+        args = (args, 0, 1)
+    rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+    if orientation != 1:
+        return None
+    if stride:
+        return stride
+    return RAW_PIXEL_BYTES[rawmode] * img.size[0] if rawmode in RAW_PIXEL_BYTES else None
+
+
+# Read stage, memory-budget mode: estimates the peak bytes a worker will
+# hold for source from its header alone, and whether it should be decoded
+# strip-wise. Returns (bytes, banded).
+def memory_estimate(source, draft=True, profiles=None, image_limit=None):
+    profiles = profiles or default_profiles()
+    held = len(source) if isinstance(source, bytes) else 0
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        w, h = img.size
+        sizes = rendition_sizes(w, h, profiles)
+        # Decoding is sized for the largest rendition
+        new_w, new_h = max(sizes)
+        output = sum(rw * rh for rw, rh in sizes) * 4 * 2  # renditions plus encoded buffers
+        scale = 1
+        if draft and img.format == "JPEG":
+            # What draft() will pick: the largest DCT scale still covering the output
+            while scale < 8 and w // (scale * 2) >= new_w and h // (scale * 2) >= new_h:
+                scale *= 2
+        decoded = (w // scale) * (h // scale) * pixel_bytes(img.mode)
+        if image_limit is not None and decoded > image_limit and raw_row_bytes(img):
+            factor = reduce_factor(w, h, new_w, new_h)
+            return held + min(decoded, BAND_BYTES) * 2 + decoded // (factor * factor) + output, True
+        # Pillow's separable resize holds a (new_w x h) horizontal pass too
+        return held + decoded + new_w * (h // scale) * 4 + output, False
+
+
+# Decodes plain uncompressed rows a band at a time, box-reducing each band
+# by factor as it arrives. Band heights are multiples of factor, so the
+# result is the same as reducing the whole image at once.
+def reduce_banded(source, img, factor):
+    w, h = img.size
+    codec, extents, offset, args = img.tile[0]
+    row_bytes = raw_row_bytes(img)
+    rows = max(factor, BAND_BYTES // (w * pixel_bytes(img.mode)) // factor * factor)
+    reduced = None
+    for top in range(0, h, rows):
+        n = min(rows, h - top)
+        if not isinstance(source, str):
+            source.seek(0)
+        with Image.open(source) as band:
+            band._size = (w, n)
+            band.tile = [(codec, (0, 0, w, n), offset + top * row_bytes, args)]
+            band.load()
+            part = band if band.mode in ("L", "RGB") else band.convert("RGB")
+            part = part.reduce(factor)
+        if reduced is None:
+            reduced = Image.new(part.mode, (-(-w // factor), -(-h // factor)))
+        reduced.paste(part, (0, top // factor))
+    return reduced
+
+
+# Resize stage: runs in a pool worker process, so it must stay at module
+# level and must not touch any UI state. Decodes once and renders every
+# output profile from that decode, in memory; returns the source size, a
+# (size, encoded bytes or None in test mode, method) triple per profile
+# and, when timing is on, seconds spent in each step. Each rendition takes
+# the cheapest method that gives the same result (see fast_path). banded
+# asks for strip-wise decoding (see memory_estimate).
+def resize_image(source, test, draft=True, profiles=None, timing=False, banded=False):
+    profiles = profiles or default_profiles()
+    timings = {}
+    started = time.perf_counter()
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        w, h = img.size
+        fmt = img.format
+        sizes = rendition_sizes(w, h, profiles)
+        methods = plan_methods(fmt, w, h, sizes, profiles, draft)
+        started = lap(timings, "open", started)
+        if test:
+            return (w, h), [(size, None, method) for size, method in zip(sizes, methods)], timings if timing else {}
+
+        outputs = [None] * len(profiles)
+        if "copy" in methods:
+            raw = source.getvalue() if isinstance(source, io.BytesIO) else read_file(source)
+            for i, method in enumerate(methods):
+                if method == "copy":
+                    outputs[i] = (sizes[i], copy_bytes(raw, fmt, profiles[i]), "copy")
+            del raw
+        todo = [i for i in range(len(profiles)) if outputs[i] is None]
+        if not todo:
+            return (w, h), outputs, timings if timing else {}
+
+        # The decode is sized for the largest rendition
+        new_w, new_h = max(sizes[i] for i in todo)
+        source_info = {key: img.info.get(key) for key in ("exif", "icc_profile")}
+        if banded:
+            img = reduce_banded(source, img, reduce_factor(w, h, new_w, new_h))
+            started = lap(timings, "decode", started)
+        else:
+            if draft:
+                # Reduced-resolution JPEG decode, then a cheap integer
+                # reduce for other formats before the final resample.
+                img.draft("RGB", (new_w, new_h))
+            img.load()
+            started = lap(timings, "decode", started)
+
+        # Largest first, each downscale starting from the smallest image
+        # already made that still covers it (2160p -> 1080p -> 320px). A
+        # decode that came out at exactly the right size is used as it is.
+        rendered = {}
+        bases = [img]
+        for i in sorted(todo, key=lambda i: sizes[i], reverse=True):
+            size = sizes[i]
+            if img.size == size:
+                rendered[i] = img
+                methods[i] = "encode" if size == (w, h) else "resample" if banded else "dct"
+                continue
+            base = min((b for b in bases if b.width >= size[0] and b.height >= size[1]),
+                       key=lambda b: b.width, default=img)
+            resample = Image.Resampling[profiles[i]["filter"]]
+            if draft:
+                rendered[i] = base.resize(size, resample, reducing_gap=REDUCING_GAP)
+            else:
+                rendered[i] = base.resize(size, resample)
+            methods[i] = "resample"
+            if size[0] < img.width:
+                bases.append(rendered[i])  # never start from an upscale
+        started = lap(timings, "resize", started)
+        del bases
+        for i in todo:
+            outputs[i] = (sizes[i], encode(rendered[i], profiles[i], source_info), methods[i])
+        lap(timings, "encode", started)
+        return (w, h), outputs, timings if timing else {}
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# Resize stage for a file whose every rendition is a straight copy (see
+# fast_path): nothing is decoded, so it runs in the dispatcher rather than
+# the pool. With link, unchanged copies are marked to be hard-linked.
+def copy_renditions(source, info, profiles, link=False):
+    raw = source if isinstance(source, bytes) else read_file(source)
+    size = (info["width"], info["height"])
+    outputs = []
+    for profile in profiles:
+        data = copy_bytes(raw, info["format"], profile)
+        outputs.append((size, data, "link" if link and data is raw else "copy"))
+    return size, outputs, {}
+
+
+def lap(timings, stage, started):
+    now = time.perf_counter()
+    timings[stage] = now - started
+    return now
+
+
+# Write stage (I/O thread). Replaces rather than overwrites, so an output
+# hard-linked to a duplicate's (see link_output) is never changed under it.
+def write_output(dst_root, rel_path, data):
+    dest_file = os.path.join(dst_root, rel_path)
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    with open(dest_file + ".tmp", 'wb') as f:
+        f.write(data)
+    os.replace(dest_file + ".tmp", dest_file)
+    return len(data)
+
+
+# Output for a duplicate source: a hard link to the original's output where
+# the filesystem allows, else a copy. Returns the output size.
+def link_output(dst_root, original, rel_path):
+    return link_file(os.path.join(dst_root, original), os.path.join(dst_root, rel_path))
+
+
+def link_file(src_file, dest_file):
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    if os.path.exists(dest_file):
+        if os.path.samefile(src_file, dest_file):
+            return os.path.getsize(dest_file)
+        os.remove(dest_file)
+    try:
+        os.link(src_file, dest_file)
+    except OSError:
+        shutil.copy2(src_file, dest_file)
+    return os.path.getsize(dest_file)
+
+
+class MemoryBudget:
+    # Bytes of decode work admitted to the pool at once. A file costing more
+    # than the whole budget is admitted alone, once everything else is done.
+
+    def __init__(self, total):
+        self.total = total
+        self.free = total
+        self.cond = threading.Condition()
+
+    def acquire(self, cost):
+        cost = min(cost, self.total)
+        with self.cond:
+            while self.free < cost:
+                self.cond.wait()
+            self.free -= cost
+        return cost
+
+    def release(self, cost):
+        with self.cond:
+            self.free += cost
+            self.cond.notify_all()
+
+
+class ResizeEngine:
+    # Scans a source tree and resizes it into a mirrored destination tree.
+    # Progress is reported as plain dicts with an "event" key, passed to
+    # report(); front ends turn them into log lines or JSON lines.
+
+    def __init__(self, src_root, dst_root, workers=None, test=False, draft=True,
+                 incremental=True, target=TARGET_SIZE, report=None, scan_threads=SCAN_THREADS,
+                 read_threads=READ_THREADS, write_threads=WRITE_THREADS, queue_depth=None, timing=False,
+                 probe=False, probes=None, memory_budget=None, image_limit=None, dedupe=False,
+                 duplicates=None, profiles=None, link_unchanged=False, dup_index=None):
+        self.src_root = src_root
+        self.dst_root = dst_root
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.test = test
+        self.draft = draft
+        self.incremental = incremental
+        self.target = target
+        # Output profiles (see output_profiles); all are made from one decode.
+        # Without them the engine writes a single JPEG at target.
+        self.profiles = profiles or default_profiles(target)
+        # Outputs that would be byte-identical to their source are hard-linked
+        # to it instead of written (see fast_path)
+        self.link_unchanged = link_unchanged
+        self.scan_threads = max(1, scan_threads)
+        self.read_threads = max(1, read_threads)
+        self.write_threads = max(1, write_threads)
+        self.queue_depth = max(1, queue_depth or self.workers * 2)
+        self.timing = timing
+        # Header probes (rel_path -> image_probe info), taken during the scan
+        # when probe is set, else on first use; pass probes to share them
+        # between engines over the same scan.
+        self.probe = probe
+        self.probes = probes if probes is not None else {}
+        # Memory-budget mode (bytes; None is off): work is admitted to the
+        # pool by estimated peak memory, and files estimated over image_limit
+        # (default: an even share of the budget per worker) are streamed.
+        self.memory_budget = memory_budget
+        # With dedupe the scan finds byte-identical sources (dup_index) and
+        # fills duplicates (copy rel_path -> rel_path kept); run resizes each
+        # image once and links the copies' output to it. The hash cache
+        # lives next to the manifest in dst unless dup_index names a file;
+        # test mode writes nothing, so there it is kept in memory.
+        self.dedupe = dedupe
+        self.dup_index = dup_index or (":memory:" if test else os.path.join(dst_root, INDEX_NAME))
+        self.duplicates = duplicates if duplicates is not None else {}
+        self.image_limit = image_limit or (memory_budget // self.workers if memory_budget else None)
+        self.report = report or (lambda event: None)
+        self.going = False
+        self.scanning = False
+
+        self.source_list = []
+        self.file_sizes = {}  # rel_path -> bytes, for everything in source_list
+        self.total_input_size = 0
+        self.total_output_size = 0
+        self.estimated_output_size = 0
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.linked = 0
+        self.methods = Counter()  # renditions made by each fast_path method
+
+    def stop(self):
+        self.going = False
+        self.scanning = False
+
+    def scan(self):
+        if not os.path.isdir(self.src_root):
+            self.report({"event": "error", "message": "Invalid source directory."})
+            return False
+
+        self.report({"event": "scan_start", "src": self.src_root})
+        self.scanning = True
+        self.source_list.clear()
+        self.probes.clear()
+        self.duplicates.clear()
+        self.file_sizes.clear()
+        self.total_input_size = 0
+        last_log = time.time()
+
+        # Directories are listed concurrently; each finished listing queues
+        # its subdirectories and appends its files to source_list right away.
+        with ThreadPoolExecutor(max_workers=self.scan_threads) as pool:
+            pending = {pool.submit(scan_dir, self.src_root, self.probe): self.src_root}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        files, subdirs = future.result()
+                    except OSError as e:
+                        self.report({"event": "error", "message": f"cannot read {path} — {e}"})
+                        continue
+                    for full_path, size, info in files:
+                        rel_path = os.path.relpath(full_path, self.src_root)
+                        self.source_list.append(rel_path)
+                        self.total_input_size += size
+                        self.file_sizes[rel_path] = size
+                        if info:
+                            self.probes[rel_path] = info
+                    if self.scanning:
+                        for subdir in subdirs:
+                            pending[pool.submit(scan_dir, subdir, self.probe)] = subdir
+
+                if not self.scanning:
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+
+                if time.time() - last_log > 0.5:
+                    self.report({"event": "scan_progress", "files": len(self.source_list),
+                                 "input_bytes": self.total_input_size})
+                    last_log = time.time()
+
+        self.source_list.sort()
+        if self.dedupe and self.scanning:
+            self.find_duplicates(self.file_sizes)
+        cancelled = not self.scanning
+        self.scanning = False
+        self.report({"event": "scan", "files": len(self.source_list), "input_bytes": self.total_input_size,
+                     "cancelled": cancelled})
+        return not cancelled
+
+    def find_duplicates(self, file_sizes):
+        self.report({"event": "dedupe_start", "files": len(file_sizes)})
+        try:
+            if self.dup_index != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.dup_index)), exist_ok=True)
+            index = DuplicateIndex(self.dup_index)
+            try:
+                groups = index.find([(os.path.join(self.src_root, rel_path), file_sizes[rel_path])
+                                     for rel_path in self.source_list], lambda: not self.scanning)
+            finally:
+                index.close()
+        except Exception as e:
+            self.report({"event": "error", "message": f"duplicate check failed — {e}"})
+            return
+        wasted = 0
+        for group in groups:
+            original, *copies = [os.path.relpath(path, self.src_root) for path in group]
+            for rel_path in copies:
+                self.duplicates[rel_path] = original
+                wasted += file_sizes[rel_path]
+        self.report({"event": "duplicates", "groups": len(groups), "copies": len(self.duplicates),
+                     "bytes": wasted})
+
+    # Applies changes seen by a watcher ({rel_path: "changed" | "removed"},
+    # see fs_watch) to source_list instead of rescanning. Returns (files to
+    # redo, files removed): new and modified files, plus duplicates linked
+    # to a modified original, are all a run over the same tree needs redo.
+    def apply_changes(self, changes):
+        removed, added, modified = set(), [], []
+        for rel_path, kind in changes.items():
+            stamp = file_stamp(os.path.join(self.src_root, rel_path))
+            if stamp is None:
+                # A file, or a folder and everything that was in it
+                removed.update(p for p in self.file_sizes if p == rel_path or p.startswith(rel_path + os.sep))
+                continue
+            if not rel_path.lower().endswith(PHOTO_TYPES):
+                continue
+            if rel_path in self.file_sizes:
+                modified.append(rel_path)
+                self.total_input_size -= self.file_sizes[rel_path]
+            else:
+                added.append(rel_path)
+            self.file_sizes[rel_path] = stamp[0]
+            self.total_input_size += stamp[0]
+            self.probes.pop(rel_path, None)
+
+        for rel_path in removed:
+            self.total_input_size -= self.file_sizes.pop(rel_path)
+            self.probes.pop(rel_path, None)
+        redo = set(added) | set(modified)
+        # A changed file is no longer known to equal anything; copies of a
+        # changed original get their own output again
+        for copy, original in list(self.duplicates.items()):
+            if copy in redo or copy in removed or original in redo or original in removed:
+                del self.duplicates[copy]
+                if copy not in removed:
+                    redo.add(copy)
+        self.source_list[:] = sorted((set(self.source_list) - removed) | set(added))
+        self.report({"event": "changes", "added": len(added), "modified": len(modified),
+                     "removed": len(removed), "files": len(self.source_list),
+                     "input_bytes": self.total_input_size})
+        return sorted(redo), sorted(removed)
+
+    # rel_paths limits the run to those files (from apply_changes, say);
+    # by default every file in source_list is considered.
+    def run(self, rel_paths=None):
+        files = self.source_list if rel_paths is None else rel_paths
+        self.going = True
+        self.total_output_size = 0
+        self.estimated_output_size = 0
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.linked = 0
+        self.methods.clear()
+        params = output_params(self.draft, self.profiles)
+        last_log = time.time()
+
+        # The manifest is kept up to date on every real run; incremental mode
+        # also uses it to skip files whose output is already current.
+        manifest = None
+        previous = {}
+        if not self.test:
+            try:
+                manifest = ResizeManifest(self.dst_root)
+                if self.incremental:
+                    previous = manifest.load()
+                    self.report({"event": "manifest", "entries": len(previous)})
+            except Exception as e:
+                self.report({"event": "error", "message": f"could not open manifest — {e}"})
+
+        finished = set()  # originals whose output is in place, for linking duplicates
+        self.report({"event": "start", "files": len(files), "workers": self.workers,
+                     "test": self.test, "params": params, "memory_budget": self.memory_budget,
+                     "image_limit": self.image_limit,
+                     "profiles": [profile["name"] or str(profile["target"]) for profile in self.profiles]})
+        timings = StageTimings() if self.timing else None
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for result in self.pipeline(pool, params, previous, files):
+                    self.handle_result(result)
+                    if not result["error"]:
+                        finished.add(result["rel_path"])
+                    if timings and not result["error"] and not result["skipped"]:
+                        timings.add(result["rel_path"], result["file_size"], result["timings"])
+                    if manifest and not result["error"]:
+                        manifest.record(rel_path=result["rel_path"], size=result["file_size"],
+                                        mtime_ns=result["mtime_ns"], digest=result["hash"],
+                                        params=params, output_bytes=result["output_bytes"])
+
+                    if time.time() - last_log > 1:
+                        self.report({"event": "progress", "processed": self.processed,
+                                     "skipped": self.skipped, "errors": self.errors})
+                        last_log = time.time()
+        except Exception as e:
+            self.report({"event": "error", "message": f"worker pool failed — {e}"})
+        finally:
+            if manifest:
+                manifest.close()
+
+        if self.duplicates and self.going:
+            self.link_duplicates(finished)
+
+        if timings:
+            self.report_timings(timings)
+
+        summary = {"event": "done", "stopped": not self.going, "test": self.test,
+                   "processed": self.processed, "skipped": self.skipped, "errors": self.errors,
+                   "duplicates": self.linked,
+                   "methods": {method: self.methods[method] for method in METHODS if self.methods[method]},
+                   "input_bytes": self.total_input_size, "output_bytes": self.total_output_size}
+        if self.test:
+            summary["estimated_output_bytes"] = self.estimated_output_size
+        self.going = False
+        self.report(summary)
+        return summary
+
+    def pipeline(self, pool, params, previous, files):
+        # read threads -> decode_q -> pool workers -> encoded_q -> write threads -> done_q
+        # decode_q is bounded, and a file holds one of the `slots` from the
+        # moment it is handed to the pool until its output is written, so
+        # memory is capped by queue depth rather than by image count.
+        todo = queue.Queue()
+        for rel_path in files:
+            if rel_path not in self.duplicates:
+                todo.put(rel_path)
+        decode_q = queue.Queue(maxsize=self.queue_depth)
+        encoded_q = queue.Queue()
+        done_q = queue.Queue()
+        in_flight = self.workers * 2
+        slots = threading.Semaphore(in_flight)
+        budget = MemoryBudget(self.memory_budget) if self.memory_budget else None
+        if budget:
+            # Readers open headers with PIL, which imports its format plugins
+            # on first use; do that here, so a worker forked while a reader
+            # holds the import lock can't start up deadlocked.
+            Image.init()
+
+        def reader():
+            # Checked per file, so stop() lets the pipeline drain what it holds
+            while self.going:
+                try:
+                    rel_path = todo.get_nowait()
+                except queue.Empty:
+                    break
+                result = new_result(rel_path)
+                started = time.perf_counter()
+                try:
+                    source = read_source(self.src_root, self.dst_root, rel_path, self.test, params,
+                                         previous.get(rel_path), result, self.probes, self.profiles,
+                                         self.image_limit, self.draft)
+                    fast = None
+                    if source is not None and not self.test:
+                        # Sources that need no decoding at all skip the pool
+                        info = self.probes.get(rel_path) or probe_image(source)
+                        if info:
+                            sizes = rendition_sizes(info["width"], info["height"], self.profiles)
+                            methods = plan_methods(info["format"], info["width"], info["height"], sizes,
+                                                   self.profiles, self.draft)
+                            if all(method == "copy" for method in methods):
+                                fast = info
+                    if budget and source is not None and not self.test and not fast:
+                        result["memory"], result["banded"] = memory_estimate(source, self.draft, self.profiles,
+                                                                             self.image_limit)
+                    if self.timing:
+                        result["timings"]["read"] = time.perf_counter() - started
+                except Exception as e:
+                    result["error"] = str(e)
+                    source = None
+                if source is None:
+                    done_q.put(result)
+                else:
+                    decode_q.put((result, source, fast))
+            decode_q.put(None)
+
+        def dispatcher():
+            readers_left = self.read_threads
+            while readers_left:
+                item = decode_q.get()
+                if item is None:
+                    readers_left -= 1
+                    continue
+                result, source, fast = item
+                slots.acquire()
+                if budget:
+                    result["memory"] = budget.acquire(result["memory"])
+                try:
+                    if fast:
+                        future = Future()
+                        try:
+                            future.set_result(copy_renditions(source, fast, self.profiles, self.link_unchanged))
+                        except Exception as e:
+                            future.set_exception(e)
+                    else:
+                        future = pool.submit(resize_image, source, self.test, self.draft, self.profiles,
+                                             self.timing, result["banded"])
+                except Exception as e:
+                    slots.release()
+                    if budget:
+                        budget.release(result["memory"])
+                    result["error"] = str(e)
+                    done_q.put(result)
+                    continue
+                future.add_done_callback(lambda f, result=result: encoded_q.put((result, f)))
+            # Every slot back means every file has been written
+            for _ in range(in_flight):
+                slots.acquire()
+            for _ in range(self.write_threads):
+                encoded_q.put(None)
+
+        def writer():
+            while True:
+                item = encoded_q.get()
+                if item is None:
+                    break
+                result, future = item
+                try:
+                    result["size"], outputs, stage_times = future.result()
+                    result["timings"].update(stage_times)
+                    sizes = [size for size, _, _ in outputs]
+                    result["new_size"] = sizes[0]
+                    result["renditions"] = [{"path": output_path(result["rel_path"], profile), "size": size,
+                                             "method": method}
+                                            for profile, (size, _, method) in zip(self.profiles, outputs)]
+                    if self.test:
+                        result["estimated_bytes"] = estimated_bytes(sizes, self.profiles)
+                    else:
+                        started = time.perf_counter()
+                        for rendition, (_, data, method) in zip(result["renditions"], outputs):
+                            if method == "link":
+                                rendition["bytes"] = link_file(os.path.join(self.src_root, result["rel_path"]),
+                                                               os.path.join(self.dst_root, rendition["path"]))
+                            else:
+                                rendition["bytes"] = write_output(self.dst_root, rendition["path"], data)
+                            result["output_bytes"] += rendition["bytes"]
+                        if self.timing:
+                            result["timings"]["write"] = time.perf_counter() - started
+                except Exception as e:
+                    result["error"] = str(e)
+                slots.release()
+                if budget:
+                    budget.release(result["memory"])
+                done_q.put(result)
+            done_q.put(None)
+
+        threads = [threading.Thread(target=reader, daemon=True) for _ in range(self.read_threads)]
+        threads.append(threading.Thread(target=dispatcher, daemon=True))
+        threads += [threading.Thread(target=writer, daemon=True) for _ in range(self.write_threads)]
+        for t in threads:
+            t.start()
+
+        writers_left = self.write_threads
+        while writers_left:
+            result = done_q.get()
+            if result is None:
+                writers_left -= 1
+            else:
+                yield result
+
+    def link_duplicates(self, finished):
+        for rel_path, original in self.duplicates.items():
+            if original not in finished:
+                continue  # its original failed; nothing to link to
+            result = new_result(rel_path)
+            try:
+                if not self.test:
+                    for profile in self.profiles:
+                        result["output_bytes"] += link_output(self.dst_root, output_path(original, profile),
+                                                              output_path(rel_path, profile))
+                    self.total_output_size += result["output_bytes"]
+                self.linked += 1
+            except OSError as e:
+                result["error"] = str(e)
+                self.errors += 1
+            self.report({"event": "file", "status": "error" if result["error"] else "duplicate",
+                         "duplicate_of": original, **{k: v for k, v in result.items() if k != "timings"}})
+
+    def report_timings(self, timings):
+        report = timings.report()
+        event = {"event": "timing_report", **report}
+        if not self.test and report["files"]:
+            try:
+                event["json_report"], event["csv_report"] = timings.save(self.dst_root, report)
+            except OSError as e:
+                self.report({"event": "error", "message": f"could not save timing report — {e}"})
+        self.report(event)
+
+    def handle_result(self, result):
+        if result["error"]:
+            self.errors += 1
+            status = "error"
+        elif result["skipped"]:
+            self.total_output_size += result["output_bytes"]
+            self.skipped += 1
+            status = "skipped"
+        else:
+            self.total_output_size += result["output_bytes"]
+            self.estimated_output_size += result["estimated_bytes"]
+            self.processed += 1
+            self.methods.update(rendition["method"] for rendition in result["renditions"])
+            status = "done"
+        event = {"event": "file", "status": status, **result}
+        if not self.timing:
+            del event["timings"]
+        self.report(event)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Resize all images in a sub-tree to full HD, mirroring the tree in the destination. "
+                    "Progress is written to stdout as JSON lines.")
+    parser.add_argument("--src", required=True, help="source directory")
+    parser.add_argument("--dst", default="", help="destination directory (not needed with --test)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--test", action="store_true", help="report sizes only, write nothing")
+    parser.add_argument("--target", type=int, default=TARGET_SIZE, help="output short edge in pixels")
+    parser.add_argument("--profiles",
+                        help="output profiles, each written to its own subfolder: comma-separated presets "
+                             f"({', '.join(PRESETS)}) or a JSON file listing profile dicts "
+                             "(default: one JPEG at --target, mirroring the source tree)")
+    parser.add_argument("--no-draft", action="store_true", help="always decode JPEGs at full resolution")
+    parser.add_argument("--no-incremental", action="store_true", help="redo files the manifest says are current")
+    parser.add_argument("--scan-threads", type=int, default=SCAN_THREADS, help="threads listing directories")
+    parser.add_argument("--read-threads", type=int, default=READ_THREADS, help="threads reading source files")
+    parser.add_argument("--write-threads", type=int, default=WRITE_THREADS, help="threads writing output files")
+    parser.add_argument("--queue-depth", type=int, help="files read ahead of the workers (default 2 per worker)")
+    parser.add_argument("--timing", action="store_true",
+                        help="time each stage per file; report saved as JSON and CSV in the destination")
+    parser.add_argument("--link-unchanged", action="store_true",
+                        help="hard-link outputs that would be byte-identical to their source instead of copying "
+                             "them (editing either then changes both)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="resize byte-identical sources once and hard-link (or copy) the other outputs")
+    parser.add_argument("--dup-index",
+                        help=f"hash cache for --dedupe (default: DST/{INDEX_NAME}; none in test mode)")
+    parser.add_argument("--memory-budget", type=int,
+                        help="MB of estimated decode memory the workers may use at once (default: no limit)")
+    parser.add_argument("--image-limit", type=int,
+                        help="MB above which an image is streamed and, if uncompressed, decoded strip-wise "
+                             "(default: budget / workers)")
+    args = parser.parse_args(argv)
+    if not args.test and not args.dst:
+        parser.error("--dst is required unless --test is given")
+    try:
+        profiles = load_profiles(args.profiles) if args.profiles else None
+    except (OSError, ValueError) as e:
+        parser.error(f"--profiles: {e}")
+
+    def report(event):
+        sys.stdout.write(json.dumps(event) + "\n")
+        sys.stdout.flush()
+
+    engine = ResizeEngine(args.src, args.dst, workers=args.workers, test=args.test, draft=not args.no_draft,
+                          incremental=not args.no_incremental, target=args.target, report=report,
+                          scan_threads=args.scan_threads, read_threads=args.read_threads,
+                          write_threads=args.write_threads, queue_depth=args.queue_depth, timing=args.timing,
+                          probe=args.test, memory_budget=args.memory_budget and args.memory_budget * 1024 * 1024,
+                          image_limit=args.image_limit and args.image_limit * 1024 * 1024, dedupe=args.dedupe,
+                          dup_index=args.dup_index, profiles=profiles, link_unchanged=args.link_unchanged)
+    if not engine.scan():
+        return 2
+    summary = engine.run()
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
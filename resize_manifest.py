@@ -0,0 +1,43 @@
+import os
+import sqlite3
+import time
+
+MANIFEST_NAME = ".resize_manifest.db"
+
+
+class ResizeManifest:
+    # Records, per source file, what was last written to the destination:
+    # the source's rel-path, size, mtime and content hash, plus the output
+    # parameters used. Each row is committed as its file finishes (cheap with
+    # WAL and synchronous=NORMAL), so a stopped or crashed run can pick up
+    # where it left off.
+
+    def __init__(self, dst_root):
+        os.makedirs(dst_root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(dst_root, MANIFEST_NAME))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                rel_path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                params TEXT NOT NULL,
+                output_bytes INTEGER NOT NULL,
+                done REAL NOT NULL
+            )""")
+        self.db.commit()
+
+    def load(self):
+        rows = self.db.execute("SELECT rel_path, size, mtime_ns, hash, params, output_bytes FROM files")
+        return {r[0]: {"size": r[1], "mtime_ns": r[2], "hash": r[3], "params": r[4], "output_bytes": r[5]}
+                for r in rows}
+
+    def record(self, rel_path, size, mtime_ns, digest, params, output_bytes):
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (rel_path, size, mtime_ns, digest, params, output_bytes, time.time()))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
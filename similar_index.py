@@ -0,0 +1,69 @@
+from PIL import Image
+
+# Near-duplicate detection for the sorter. Each thumbnail gets a 64-bit
+# difference hash (dHash): shrink to 9x8 greyscale and record whether each
+# pixel is brighter than its right-hand neighbour. Shots of the same scene
+# differ in only a few bits.
+#
+# Pairs within max_distance bits are found without comparing every pair:
+# the hash is cut into max_distance + 1 slices, and two hashes that differ
+# in at most max_distance bits must agree exactly on at least one slice.
+# Only hashes sharing a slice value are compared.
+
+HASH_SIZE = 8
+SIMILAR_DISTANCE = 6
+
+
+def dhash(img):
+    small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def slice_masks(max_distance, bits=HASH_SIZE * HASH_SIZE):
+    # (shift, mask) for max_distance + 1 slices covering all bits
+    count = max_distance + 1
+    masks, start = [], 0
+    for i in range(count):
+        width = bits // count + (1 if i < bits % count else 0)
+        masks.append((start, (1 << width) - 1))
+        start += width
+    return masks
+
+
+def group_similar(hashes, max_distance=SIMILAR_DISTANCE):
+    # hashes: {key: hash}. Returns groups (lists of keys, in the order given)
+    # of images linked by chains of hashes within max_distance bits.
+    keys = list(hashes)
+    parent = list(range(len(keys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for shift, mask in slice_masks(max_distance):
+        buckets = {}
+        for i, key in enumerate(keys):
+            buckets.setdefault((hashes[key] >> shift) & mask, []).append(i)
+        for members in buckets.values():
+            for n, i in enumerate(members):
+                for j in members[n + 1:]:
+                    root_i, root_j = find(i), find(j)
+                    if root_i != root_j and hamming(hashes[keys[i]], hashes[keys[j]]) <= max_distance:
+                        parent[root_j] = root_i
+
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(find(i), []).append(key)
+    return [group for group in groups.values() if len(group) > 1]
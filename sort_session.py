@@ -0,0 +1,53 @@
+import os
+
+# A sorter session over a whole tree: every folder below the root that holds
+# images, and what the sorter keeps in memory for a folder it has left, so
+# switching back is instant and unsaved reorders aren't lost.
+
+SORTABLE_TYPES = (".jpg", ".jpeg", ".png")
+
+
+def list_images(directory):
+    return [f for f in sorted(os.listdir(directory)) if f.lower().endswith(SORTABLE_TYPES)]
+
+
+def index_tree(root, cancelled=None):
+    # [(folder, image count)] for root and every folder below it that has
+    # images; parents before children, names sorted, hidden folders skipped
+    folders = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if cancelled and cancelled():
+            break
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        count = sum(1 for f in filenames if f.lower().endswith(SORTABLE_TYPES))
+        if count:
+            folders.append((dirpath, count))
+    return folders
+
+
+def likely_next(total, index, count):
+    # Indices of the folders most likely opened after index: the next one,
+    # then the previous one, then further out, up to count of them
+    order = []
+    step = 1
+    while len(order) < count and step < total:
+        for i in (index + step, index - step):
+            if 0 <= i < total and len(order) < count:
+                order.append(i)
+        step += 1
+    return order
+
+
+class FolderState:
+    # A folder left once it had finished loading: its entries in the order
+    # they were left, the on-disk order (so a reorder not yet renamed stays
+    # pending) and the filename prefix typed for it.
+    __slots__ = ("image_data", "on_disk_order", "prefix")
+
+    def __init__(self, image_data, on_disk_order, prefix):
+        self.image_data = image_data
+        self.on_disk_order = on_disk_order
+        self.prefix = prefix
+
+    def reordered(self):
+        return [d.filename for d in self.image_data] != self.on_disk_order
@@ -0,0 +1,82 @@
+import os
+import csv
+import json
+import time
+import datetime
+
+# Aggregates per-file, per-stage timings from a resize run into histograms,
+# percentiles, throughput and the slowest files, and writes the run report.
+
+STAGES = ("read", "open", "decode", "resize", "encode", "write")
+HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+SLOWEST_N = 10
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+    return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99), "max_ms": pick(1.0)}
+
+
+def histogram(values):
+    buckets = {f"<={limit}ms": 0 for limit in HISTOGRAM_MS}
+    buckets[f">{HISTOGRAM_MS[-1]}ms"] = 0
+    for seconds in values:
+        ms = seconds * 1000
+        label = next((f"<={limit}ms" for limit in HISTOGRAM_MS if ms <= limit), f">{HISTOGRAM_MS[-1]}ms")
+        buckets[label] += 1
+    return buckets
+
+
+class StageTimings:
+    def __init__(self):
+        self.start = time.time()
+        self.rows = []  # (rel_path, input bytes, {stage: seconds})
+        self.input_bytes = 0
+
+    def add(self, rel_path, file_size, timings):
+        if not timings:
+            return
+        self.rows.append((rel_path, file_size or 0, timings))
+        self.input_bytes += file_size or 0
+
+    def report(self):
+        seconds = max(time.time() - self.start, 1e-9)
+        stages = {}
+        for stage in STAGES:
+            values = [t[stage] for _, _, t in self.rows if stage in t]
+            if values:
+                stages[stage] = {"count": len(values), "total_s": round(sum(values), 3),
+                                 "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                                 **percentiles(values), "histogram": histogram(values)}
+        slowest = sorted(self.rows, key=lambda row: sum(row[2].values()), reverse=True)[:SLOWEST_N]
+        return {
+            "files": len(self.rows),
+            "seconds": round(seconds, 3),
+            "files_per_sec": round(len(self.rows) / seconds, 2),
+            "input_mb_per_sec": round(self.input_bytes / (1024 * 1024) / seconds, 2),
+            "stages": stages,
+            "slowest": [{"rel_path": rel_path, "total_ms": round(sum(t.values()) * 1000, 2),
+                         **{f"{stage}_ms": round(v * 1000, 2) for stage, v in t.items()}}
+                        for rel_path, _, t in slowest],
+        }
+
+    def save(self, dst_root, report):
+        # JSON summary plus a CSV with one row per file, next to the output
+        timestamp = datetime.datetime.now().isoformat(timespec="seconds").replace(":", "-")
+        json_path = os.path.join(dst_root, f"resize_timing_{timestamp}.json")
+        csv_path = os.path.join(dst_root, f"resize_timing_{timestamp}.csv")
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["rel_path", "input_bytes", *(f"{stage}_ms" for stage in STAGES), "total_ms"])
+            for rel_path, file_size, t in self.rows:
+                writer.writerow([rel_path, file_size,
+                                 *(round(t[stage] * 1000, 3) if stage in t else "" for stage in STAGES),
+                                 round(sum(t.values()) * 1000, 3)])
+        return json_path, csv_path
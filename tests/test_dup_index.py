@@ -0,0 +1,70 @@
+import os
+import pytest
+import dup_index
+from dup_index import DuplicateIndex, PARTIAL_BYTES
+from resize_core import ResizeEngine
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path), len(data)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = DuplicateIndex(str(tmp_path / "index.db"), threads=2)
+    yield index
+    index.close()
+
+
+def big(middle):
+    # Same size, same first and last PARTIAL_BYTES: only a full hash tells them apart
+    return b"a" * PARTIAL_BYTES + middle * 1000 + b"z" * PARTIAL_BYTES
+
+
+def test_files_differing_only_in_the_middle(tmp_path, index):
+    files = [write(tmp_path / "1.jpg", big(b"x")), write(tmp_path / "2.jpg", big(b"y")),
+             write(tmp_path / "3.jpg", big(b"x"))]
+    assert index.find(files) == [[files[0][0], files[2][0]]]
+
+
+def test_small_files_are_hashed_whole(tmp_path, index):
+    small = PARTIAL_BYTES // 2
+    files = [write(tmp_path / "1.jpg", b"q" * small), write(tmp_path / "2.jpg", b"q" * (small - 1) + b"r"),
+             write(tmp_path / "3.jpg", b"q" * small), write(tmp_path / "4.jpg", b"")]
+    assert index.find(files) == [[files[0][0], files[2][0]]]
+
+
+def test_unique_sizes_are_never_read(tmp_path, index, monkeypatch):
+    files = [write(tmp_path / "1.jpg", b"1"), write(tmp_path / "2.jpg", b"22")]
+    monkeypatch.setattr(dup_index, "partial_hash", lambda path, size: pytest.fail("read"))
+    assert index.find(files) == []
+
+
+def test_cached_hashes_are_reused_until_the_file_changes(tmp_path, index, monkeypatch):
+    files = [write(tmp_path / "1.jpg", big(b"x")), write(tmp_path / "2.jpg", big(b"x"))]
+    assert len(index.find(files)) == 1
+
+    calls = []
+    real_full_hash = dup_index.full_hash
+    monkeypatch.setattr(dup_index, "full_hash", lambda path: calls.append(path) or real_full_hash(path))
+    assert len(index.find(files)) == 1
+    assert calls == []
+
+    write(tmp_path / "2.jpg", big(b"y"))
+    os.utime(files[1][0], ns=(1, 1))
+    assert index.find(files) == []
+    assert calls == [os.path.abspath(files[1][0])]
+
+
+def test_test_mode_dedupe_writes_nothing(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.mkdir()
+    write(src / "a.jpg", b"same")
+    write(src / "b.jpg", b"same")
+    monkeypatch.chdir(tmp_path)
+    engine = ResizeEngine(str(src), "", test=True, dedupe=True)
+    assert engine.scan()
+    assert engine.duplicates == {"b.jpg": "a.jpg"}
+    assert sorted(os.listdir(tmp_path)) == ["src"]
@@ -0,0 +1,81 @@
+import io
+from PIL import Image
+from fast_path import plan_methods, strip_jpeg_metadata, copy_bytes
+from output_profiles import make_profile, load_profiles
+from resize_core import rendition_sizes
+
+def exif():
+    tags = Image.Exif()
+    tags[274] = 1
+    return tags.tobytes()
+
+
+def jpeg(size=(64, 48), **options):
+    buf = io.BytesIO()
+    Image.new("RGB", size, "red").save(buf, "JPEG", **options)
+    return buf.getvalue()
+
+
+def markers(data):
+    # Segment markers ahead of the scan
+    found = []
+    pos = 2
+    while data[pos + 1] != 0xDA:
+        found.append(data[pos + 1])
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+    return found
+
+
+def test_strip_drops_exif_and_comments_keeps_jfif():
+    data = jpeg(exif=exif(), comment=b"hello")
+    assert 0xE1 in markers(data) and 0xFE in markers(data)
+    stripped = strip_jpeg_metadata(data)
+    assert 0xE1 not in markers(stripped) and 0xFE not in markers(stripped)
+    assert 0xE0 in markers(stripped)
+    with Image.open(io.BytesIO(data)) as a, Image.open(io.BytesIO(stripped)) as b:
+        assert a.tobytes() == b.tobytes()
+
+
+def test_strip_returns_same_object_when_nothing_to_drop():
+    data = jpeg()
+    assert strip_jpeg_metadata(data) is data
+    assert strip_jpeg_metadata(b"not a jpeg") == b"not a jpeg"
+
+
+def test_strip_leaves_truncated_headers_alone():
+    data = jpeg(exif=exif())[:30]
+    assert strip_jpeg_metadata(data) is data
+
+
+def test_copy_keeps_metadata_when_profile_does():
+    data = jpeg(exif=exif())
+    assert copy_bytes(data, "JPEG", make_profile(metadata="keep")) is data
+    assert copy_bytes(data, "JPEG", make_profile()) != data
+
+
+def plan(fmt, w, h, profiles, draft=True):
+    return plan_methods(fmt, w, h, rendition_sizes(w, h, profiles), profiles, draft)
+
+
+def test_small_sources_are_copied_or_encoded():
+    profiles = [make_profile()]
+    assert plan("JPEG", 800, 600, profiles) == ["copy"]
+    assert plan("PNG", 800, 600, profiles) == ["encode"]
+    assert plan("PNG", 800, 600, [make_profile(format="PNG")]) == ["encode"]  # PNG metadata isn't stripped
+    assert plan("PNG", 800, 600, [make_profile(format="PNG", metadata="keep")]) == ["copy"]
+    assert plan("JPEG", 800, 600, [make_profile(upscale=True)]) == ["resample"]
+
+
+def test_exact_dct_scales():
+    profiles = [make_profile()]
+    assert plan("JPEG", 3840, 2160, profiles) == ["dct"]
+    assert plan("JPEG", 8640, 8640, profiles) == ["dct"]
+    assert plan("JPEG", 3000, 2000, profiles) == ["resample"]
+    assert plan("JPEG", 3840, 2160, profiles, draft=False) == ["resample"]
+    assert plan("PNG", 3840, 2160, profiles) == ["resample"]
+
+
+def test_dct_is_planned_for_the_largest_rendition_not_copied():
+    profiles = load_profiles("2160,1080,web320")
+    assert plan("JPEG", 2160, 3240, profiles) == ["copy", "dct", "resample"]
+    assert plan("JPEG", 4320, 6480, profiles) == ["dct", "resample", "resample"]
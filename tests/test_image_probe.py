@@ -0,0 +1,49 @@
+import io
+from PIL import Image
+from image_probe import probe_image, oriented_size
+
+
+def encoded(img, fmt, **options):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def test_jpeg_size_and_orientation():
+    exif = Image.Exif()
+    exif[274] = 6
+    data = encoded(Image.new("RGB", (300, 200)), "JPEG", exif=exif.tobytes())
+    info = probe_image(data)
+    assert info["format"] == "JPEG"
+    assert (info["width"], info["height"], info["orientation"]) == (300, 200, 6)
+    assert (info["bands"], info["bits"]) == (3, 8)
+    assert oriented_size(info) == (200, 300)
+
+
+def test_progressive_grey_jpeg():
+    info = probe_image(encoded(Image.new("L", (123, 45)), "JPEG", progressive=True))
+    assert (info["width"], info["height"], info["bands"], info["orientation"]) == (123, 45, 1, 1)
+
+
+def test_png():
+    info = probe_image(encoded(Image.new("RGBA", (17, 9)), "PNG"))
+    assert info["format"] == "PNG"
+    assert (info["width"], info["height"], info["bands"]) == (17, 9, 4)
+
+
+def test_tiff():
+    for compression in ("raw", "tiff_lzw"):
+        info = probe_image(encoded(Image.new("RGB", (40, 30)), "TIFF", compression=compression))
+        assert (info["format"], info["width"], info["height"], info["bands"]) == ("TIFF", 40, 30, 3)
+
+
+def test_path_and_bytes_agree(tmp_path):
+    path = tmp_path / "a.jpg"
+    Image.new("RGB", (64, 32)).save(path)
+    assert probe_image(str(path)) == probe_image(path.read_bytes())
+
+
+def test_unknown_or_truncated_input():
+    assert probe_image(b"GIF89a") is None
+    assert probe_image(encoded(Image.new("RGB", (8, 8)), "JPEG")[:10]) is None
+    assert probe_image("/no/such/file.jpg") is None
@@ -0,0 +1,39 @@
+import io
+import pytest
+from PIL import Image
+from output_profiles import make_profile, load_profiles, profile_key, output_path, encode
+from resize_core import resize_image
+
+MODES = ["1", "L", "LA", "P", "RGB", "RGBA", "CMYK", "YCbCr", "I", "I;16", "F"]
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "WEBP", "PNG"])
+@pytest.mark.parametrize("mode", MODES)
+def test_encode_any_mode(fmt, mode):
+    data = encode(Image.new(mode, (16, 8)), make_profile(format=fmt), {})
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == fmt
+        assert img.size == (16, 8)
+
+
+def test_cmyk_source_renders_every_profile():
+    buf = io.BytesIO()
+    Image.new("CMYK", (640, 480)).save(buf, "JPEG")
+    profiles = [make_profile(name="big", target=320), make_profile(name="png", target=240, format="PNG"),
+                make_profile(name="webp", target=120, format="WEBP")]
+    size, outputs, _ = resize_image(buf.getvalue(), False, profiles=profiles)
+    assert size == (640, 480)
+    assert [s for s, _, _ in outputs] == [(426, 320), (320, 240), (160, 120)]
+    for (_, data, _), fmt in zip(outputs, ["JPEG", "PNG", "WEBP"]):
+        assert Image.open(io.BytesIO(data)).format == fmt
+
+
+def test_keys_and_paths():
+    classic, web = make_profile(), load_profiles("web320")[0]
+    assert profile_key(classic) == "1080:LANCZOS:JPEG:q95:noupscale"
+    assert profile_key(make_profile(upscale=True)) == "1080:LANCZOS:JPEG:q95"
+    assert profile_key(web) == "web320=320:LANCZOS:WEBP:q80:noupscale"
+    assert output_path("a/b.jpeg", classic) == "a/b.jpeg"
+    assert output_path("a/b.jpeg", web) == "web320/a/b.webp"
+    with pytest.raises(ValueError):
+        load_profiles("nope")
@@ -0,0 +1,193 @@
+import os
+import json
+import pytest
+import rename_txn
+from rename_txn import plan_renames, run_renames, recover, JOURNAL_NAME
+
+
+def make_files(directory, names):
+    # Each file's content is its original name, so moves can be traced
+    for name in names:
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(name)
+
+
+def contents(directory):
+    # {name: original name} of every file, journal and history aside
+    result = {}
+    for name in os.listdir(directory):
+        if name.startswith(".rename_"):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            result[name] = f.read()
+    return result
+
+
+def apply(directory, renames, overwrite=False):
+    steps, conflicts = plan_renames(directory, renames)
+    run_renames(directory, steps, conflicts if overwrite else ())
+    return steps, conflicts
+
+
+def test_unchanged_names_are_not_touched(tmp_path):
+    make_files(tmp_path, ["a.jpg", "b.jpg"])
+    steps, conflicts = plan_renames(tmp_path, {"a.jpg": "a.jpg", "b.jpg": "c.jpg"})
+    assert steps == [("b.jpg", "c.jpg")]
+    assert conflicts == []
+
+
+def test_chain_runs_from_the_end(tmp_path):
+    make_files(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    renames = {"a.jpg": "b.jpg", "b.jpg": "c.jpg", "c.jpg": "d.jpg"}
+    steps, _ = apply(tmp_path, renames)
+    assert steps == [("c.jpg", "d.jpg"), ("b.jpg", "c.jpg"), ("a.jpg", "b.jpg")]
+    assert contents(tmp_path) == {"b.jpg": "a.jpg", "c.jpg": "b.jpg", "d.jpg": "c.jpg"}
+    assert not os.path.exists(os.path.join(tmp_path, JOURNAL_NAME))
+
+
+def test_cycle_goes_through_one_temporary_name(tmp_path):
+    make_files(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    renames = {"a.jpg": "b.jpg", "b.jpg": "c.jpg", "c.jpg": "a.jpg"}
+    steps, _ = apply(tmp_path, renames)
+    assert len(steps) == 4
+    assert sum(dst.startswith(rename_txn.TEMP_PREFIX) for _, dst in steps) == 1
+    assert contents(tmp_path) == {"b.jpg": "a.jpg", "c.jpg": "b.jpg", "a.jpg": "c.jpg"}
+
+
+def test_swap(tmp_path):
+    make_files(tmp_path, ["a.jpg", "b.jpg"])
+    apply(tmp_path, {"a.jpg": "b.jpg", "b.jpg": "a.jpg"})
+    assert contents(tmp_path) == {"a.jpg": "b.jpg", "b.jpg": "a.jpg"}
+
+
+def test_case_only_rename(tmp_path):
+    make_files(tmp_path, ["img.jpg", "other.jpg"])
+    apply(tmp_path, {"img.jpg": "IMG.jpg", "other.jpg": "001.jpg"})
+    assert contents(tmp_path) == {"IMG.jpg": "img.jpg", "001.jpg": "other.jpg"}
+
+
+def test_case_only_swap(tmp_path):
+    make_files(tmp_path, ["a.jpg", "B.jpg"])
+    apply(tmp_path, {"a.jpg": "b.jpg", "B.jpg": "A.jpg"})
+    assert contents(tmp_path) == {"b.jpg": "a.jpg", "A.jpg": "B.jpg"}
+
+
+def test_conflict_is_reported_and_kept_without_overwrite(tmp_path):
+    make_files(tmp_path, ["a.jpg", "b.jpg", "keep.jpg"])
+    renames = {"a.jpg": "keep.jpg", "b.jpg": "a.jpg"}
+    steps, conflicts = plan_renames(tmp_path, renames)
+    assert conflicts == ["keep.jpg"]
+    with pytest.raises(FileExistsError):
+        run_renames(tmp_path, steps)
+    # Rolled back: nothing moved, nothing lost
+    assert contents(tmp_path) == {"a.jpg": "a.jpg", "b.jpg": "b.jpg", "keep.jpg": "keep.jpg"}
+    assert not os.path.exists(os.path.join(tmp_path, JOURNAL_NAME))
+
+
+def test_conflict_overwritten_when_asked(tmp_path):
+    make_files(tmp_path, ["a.jpg", "b.jpg", "keep.jpg"])
+    apply(tmp_path, {"a.jpg": "keep.jpg", "b.jpg": "a.jpg"}, overwrite=True)
+    assert contents(tmp_path) == {"keep.jpg": "a.jpg", "a.jpg": "b.jpg"}
+
+
+class Crash(BaseException):
+    # Not an OSError, so run_renames doesn't roll back: like the process dying
+    pass
+
+
+def crash_after(monkeypatch, count):
+    real_rename = os.rename
+    calls = []
+
+    def rename(src, dst):
+        if len(calls) == count:
+            raise Crash()
+        calls.append((src, dst))
+        real_rename(src, dst)
+    monkeypatch.setattr(rename_txn.os, "rename", rename)
+
+
+CRASH_NAMES = ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "x.jpg"]
+CRASH_RENAMES = {"a.jpg": "b.jpg", "b.jpg": "a.jpg", "c.jpg": "d.jpg", "d.jpg": "e.jpg", "x.jpg": "c.jpg"}
+CRASH_RESULT = {"b.jpg": "a.jpg", "a.jpg": "b.jpg", "d.jpg": "c.jpg", "e.jpg": "d.jpg", "c.jpg": "x.jpg"}
+
+
+@pytest.mark.parametrize("crash_at", range(6))
+def test_recover_finishes_after_crash_at_each_step(tmp_path, monkeypatch, crash_at):
+    make_files(tmp_path, CRASH_NAMES)
+    steps, conflicts = plan_renames(tmp_path, CRASH_RENAMES)
+    assert len(steps) == 6 and not conflicts
+    with monkeypatch.context() as m:
+        crash_after(m, crash_at)
+        with pytest.raises(Crash):
+            run_renames(tmp_path, steps)
+    assert os.path.exists(os.path.join(tmp_path, JOURNAL_NAME))
+
+    assert recover(tmp_path) == "Finished renames interrupted last time."
+    assert contents(tmp_path) == CRASH_RESULT
+    assert not os.path.exists(os.path.join(tmp_path, JOURNAL_NAME))
+    assert recover(tmp_path) is None
+
+
+def test_recover_finishes_overwrite_after_crash(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a.jpg", "b.jpg", "keep.jpg"])
+    steps, conflicts = plan_renames(tmp_path, {"a.jpg": "keep.jpg", "b.jpg": "a.jpg"})
+    with monkeypatch.context() as m:
+        crash_after(m, 2)  # the old keep.jpg is moved aside, a.jpg is in its place
+        with pytest.raises(Crash):
+            run_renames(tmp_path, steps, conflicts)
+    recover(tmp_path)
+    assert contents(tmp_path) == {"keep.jpg": "a.jpg", "a.jpg": "b.jpg"}
+
+
+def test_recover_rolls_back_when_finishing_is_blocked(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    steps, _ = plan_renames(tmp_path, {"a.jpg": "b.jpg", "b.jpg": "c.jpg", "c.jpg": "d.jpg"})
+    with monkeypatch.context() as m:
+        crash_after(m, 1)  # c.jpg -> d.jpg done
+        with pytest.raises(Crash):
+            run_renames(tmp_path, steps)
+    # Something new took the next target while the sorter was down
+    make_files(tmp_path, ["c.jpg"])
+    message = recover(tmp_path)
+    assert message.startswith("Could not finish or undo")
+    # The undo of c.jpg -> d.jpg is blocked by the new c.jpg too, so the
+    # journal stays and nothing is lost
+    assert contents(tmp_path) == {"a.jpg": "a.jpg", "b.jpg": "b.jpg", "c.jpg": "c.jpg", "d.jpg": "c.jpg"}
+    with open(os.path.join(tmp_path, JOURNAL_NAME)) as f:
+        assert len(json.load(f)["steps"]) == 3
+
+    os.remove(os.path.join(tmp_path, "c.jpg"))
+    assert recover(tmp_path) == "Finished renames interrupted last time."
+    assert contents(tmp_path) == {"b.jpg": "a.jpg", "c.jpg": "b.jpg", "d.jpg": "c.jpg"}
+
+
+def test_recover_undoes_when_a_later_target_is_taken(tmp_path, monkeypatch):
+    make_files(tmp_path, ["a.jpg", "b.jpg"])
+    steps, _ = plan_renames(tmp_path, {"a.jpg": "c.jpg", "b.jpg": "d.jpg"})
+    with monkeypatch.context() as m:
+        crash_after(m, 1)
+        with pytest.raises(Crash):
+            run_renames(tmp_path, steps)
+    other_dst = steps[1][1]
+    make_files(tmp_path, [other_dst])  # blocks the remaining step only
+    message = recover(tmp_path)
+    assert message.startswith("Undid renames interrupted last time")
+    assert contents(tmp_path) == {"a.jpg": "a.jpg", "b.jpg": "b.jpg", other_dst: other_dst}
+    assert not os.path.exists(os.path.join(tmp_path, JOURNAL_NAME))
+
+
+@pytest.mark.parametrize("crash_at", range(3))
+def test_recover_tells_apart_files_with_the_same_size_and_mtime(tmp_path, monkeypatch, crash_at):
+    # Byte-identical copies with preserved times, or coarse timestamps
+    make_files(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        os.utime(os.path.join(tmp_path, name), ns=(1_600_000_000_000_000_000,) * 2)
+    renames = {"a.jpg": "b.jpg", "b.jpg": "c.jpg", "c.jpg": "d.jpg"}
+    steps, _ = plan_renames(tmp_path, renames)
+    with monkeypatch.context() as m:
+        crash_after(m, crash_at)
+        with pytest.raises(Crash):
+            run_renames(tmp_path, steps)
+    assert recover(tmp_path) == "Finished renames interrupted last time."
+    assert contents(tmp_path) == {"b.jpg": "a.jpg", "c.jpg": "b.jpg", "d.jpg": "c.jpg"}
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import pytest
+from PIL import Image
+from resize_core import ResizeEngine
+from resize_manifest import MANIFEST_NAME
+
+NAMES = ["a.jpg", "sub/b.jpg", "sub/c.png", "d.jpg"]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    for i, name in enumerate(NAMES):
+        path = src / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (1600 + i * 10, 1200), (i * 40, 0, 0)).save(path)
+    return str(src), str(dst)
+
+
+def run(src, dst, report=None, **options):
+    engine = ResizeEngine(src, dst, workers=2, report=report, **options)
+    assert engine.scan()
+    return engine, engine.run()
+
+
+def counts(summary):
+    return summary["processed"], summary["skipped"], summary["errors"]
+
+
+def test_rerun_skips_everything(tree):
+    src, dst = tree
+    _, summary = run(src, dst)
+    assert counts(summary) == (4, 0, 0)
+    assert all(os.path.exists(os.path.join(dst, name)) for name in NAMES)
+    _, summary = run(src, dst)
+    assert counts(summary) == (0, 4, 0)
+    assert summary["output_bytes"] > 0  # carried over from the manifest
+
+
+def test_touched_file_with_same_content_is_skipped(tree):
+    src, dst = tree
+    run(src, dst)
+    os.utime(os.path.join(src, "a.jpg"), ns=(1, 1))
+    _, summary = run(src, dst)
+    assert counts(summary) == (0, 4, 0)
+    # The new mtime was recorded, so the next run skips it on the stat alone
+    db = sqlite3.connect(os.path.join(dst, MANIFEST_NAME))
+    assert db.execute("SELECT mtime_ns FROM files WHERE rel_path='a.jpg'").fetchone() == (1,)
+
+
+def test_edited_file_is_redone(tree):
+    src, dst = tree
+    run(src, dst)
+    Image.new("RGB", (1700, 1200), "blue").save(os.path.join(src, "sub/b.jpg"))
+    _, summary = run(src, dst)
+    assert counts(summary) == (1, 3, 0)
+
+
+def test_missing_output_is_redone(tree):
+    src, dst = tree
+    run(src, dst)
+    os.remove(os.path.join(dst, "sub/c.png"))
+    _, summary = run(src, dst)
+    assert counts(summary) == (1, 3, 0)
+    assert os.path.exists(os.path.join(dst, "sub/c.png"))
+
+
+def test_changed_params_redo_everything(tree):
+    src, dst = tree
+    run(src, dst)
+    _, summary = run(src, dst, target=720)
+    assert counts(summary) == (4, 0, 0)
+    with Image.open(os.path.join(dst, "a.jpg")) as img:
+        assert img.height == 720
+    _, summary = run(src, dst, target=720)
+    assert counts(summary) == (0, 4, 0)
+
+
+def test_not_incremental_redoes_everything(tree):
+    src, dst = tree
+    run(src, dst)
+    _, summary = run(src, dst, incremental=False)
+    assert counts(summary) == (4, 0, 0)
+
+
+def test_rows_are_committed_as_files_finish(tree):
+    src, dst = tree
+    seen = []
+
+    def report(event):
+        if event["event"] == "file":
+            # Each file is recorded right after its event, so every earlier
+            # one must already be visible to another connection
+            db = sqlite3.connect(os.path.join(dst, MANIFEST_NAME))
+            rows = {r[0] for r in db.execute("SELECT rel_path FROM files")}
+            db.close()
+            assert rows == set(seen)
+            seen.append(event["rel_path"])
+    run(src, dst, report=report)
+    assert len(seen) == 4
+
+
+def test_stopped_run_resumes_where_it_left_off(tree):
+    src, dst = tree
+    for i in range(12):
+        Image.new("RGB", (1600, 1200), (0, i * 20, 0)).save(os.path.join(src, f"more{i:02d}.jpg"))
+    total = len(NAMES) + 12
+    done = []
+
+    def report(event):
+        if event["event"] == "file":
+            done.append(event["rel_path"])
+            engine.stop()
+    engine = ResizeEngine(src, dst, workers=1, queue_depth=1, report=report)
+    assert engine.scan()
+    summary = engine.run()
+    assert summary["stopped"]
+    assert 1 <= len(done) < total
+
+    _, summary = run(src, dst)
+    assert counts(summary) == (total - len(done), len(done), 0)
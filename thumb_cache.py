@@ -0,0 +1,113 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+from PIL import Image
+
+CACHE_PATH = "thumb_cache.db"
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+COMMIT_EVERY = 50
+PNG_MODES = {"1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"}
+
+
+def make_thumbnail(path, thumb_size, draft=True):
+    img = Image.open(path)
+    # thumbnail() drafts JPEGs itself, to twice the thumbnail size (its
+    # reducing_gap); draft=False decodes at full size, for benchmarking
+    img.thumbnail(thumb_size, Image.Resampling.LANCZOS, reducing_gap=2.0 if draft else None)
+    return img
+
+
+class ThumbnailCache:
+    # Thumbnails stored as PNG blobs in SQLite, keyed by absolute path and
+    # thumbnail size. An entry is only used while the file's byte size and
+    # mtime still match; least recently used entries are evicted once the
+    # cache grows past max_bytes.
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS thumbs (
+                path TEXT NOT NULL,
+                thumb_size TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (path, thumb_size)
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS thumbs_last_used ON thumbs (last_used)")
+        self.db.commit()
+
+    @staticmethod
+    def key(path, thumb_size):
+        return os.path.abspath(path), f"{thumb_size[0]}x{thumb_size[1]}"
+
+    def get(self, path, thumb_size):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = self.key(path, thumb_size)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT file_size, mtime_ns, data FROM thumbs WHERE path=? AND thumb_size=?", key).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                return None
+            self.db.execute("UPDATE thumbs SET last_used=? WHERE path=? AND thumb_size=?", (time.time(), *key))
+            self._maybe_commit()
+        img = Image.open(io.BytesIO(row[2]))
+        img.load()
+        return img
+
+    def put(self, path, thumb_size, img):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if img.mode not in PNG_MODES:
+            # CMYK and the like: PNG can't store them, so cache an RGB copy
+            img = img.convert("RGBA" if "A" in img.mode else "RGB")
+        buf = io.BytesIO()
+        try:
+            img.save(buf, "PNG")
+        except OSError:
+            return  # not cached; the thumbnail is still shown
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?)",
+                (*self.key(path, thumb_size), st.st_size, st.st_mtime_ns, buf.getvalue(), time.time()))
+            self._maybe_commit()
+
+    def _maybe_commit(self):
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+    def trim(self):
+        # Drop least recently used entries until the cache fits max_bytes
+        with self.lock:
+            total = self.db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbs").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.db.execute("SELECT rowid, LENGTH(data) FROM thumbs ORDER BY last_used").fetchall()
+                doomed = []
+                for rowid, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((rowid,))
+                    total -= size
+                self.db.executemany("DELETE FROM thumbs WHERE rowid=?", doomed)
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
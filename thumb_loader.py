@@ -0,0 +1,97 @@
+import os
+import heapq
+import threading
+from collections import deque
+from thumb_cache import make_thumbnail
+from similar_index import dhash
+from fs_watch import file_stamp
+
+THUMB_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class ThumbnailLoader:
+    # Generates thumbnails for one folder on a pool of threads. Files are
+    # taken in filename order, except that files passed to prioritize() (the
+    # rows currently in view) jump the queue, newest call first. Finished
+    # thumbnails collect in `ready` for the UI to take in batches, as
+    # (filename, image, dhash, stamp) with image and hash None for unreadable
+    # files. stamp is the file's (size, mtime_ns) from before it was read, so
+    # an edit made meanwhile shows up as a mismatch.
+
+    def __init__(self, directory, files, thumb_size, cache, workers=THUMB_WORKERS):
+        self.directory = directory
+        self.thumb_size = thumb_size
+        self.cache = cache
+        self.workers = max(1, workers)
+        # (class, generation, position, filename): class 0 = in view, 1 = background
+        self.heap = [(1, 0, i, f) for i, f in enumerate(files)]
+        self.pending = set(files)
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.ready = deque()
+        self.active = 0
+        self.cancelled = False
+
+    def start(self):
+        self.active = self.workers
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def prioritize(self, files):
+        with self.lock:
+            self.generation += 1
+            for pos, f in enumerate(files):
+                if f in self.pending:
+                    heapq.heappush(self.heap, (0, -self.generation, pos, f))
+
+    def next_file(self):
+        # Entries for files already taken are left in the heap and skipped here
+        with self.lock:
+            while self.heap:
+                f = heapq.heappop(self.heap)[3]
+                if f in self.pending:
+                    self.pending.discard(f)
+                    return f
+        return None
+
+    def take_ready(self):
+        results = []
+        while self.ready:
+            results.append(self.ready.popleft())
+        return results
+
+    def worker(self):
+        try:
+            while not self.cancelled:
+                file = self.next_file()
+                if file is None:
+                    break
+                # Every file must land in ready, or the folder never finishes loading
+                path = os.path.join(self.directory, file)
+                stamp = file_stamp(path)
+                try:
+                    img = self.load(path)
+                    self.ready.append((file, img, dhash(img) if img is not None else None, stamp))
+                except Exception as e:
+                    print(f"⚠️ Thumbnail failed for {file}: {e}")
+                    self.ready.append((file, None, None, stamp))
+        finally:
+            with self.lock:
+                self.active -= 1
+                last = self.active == 0
+            if last and not self.cancelled:
+                self.cache.trim()
+
+    def load(self, path):
+        # None marks a file that could not be opened
+        img = self.cache.get(path, self.thumb_size)
+        if img is None:
+            try:
+                img = make_thumbnail(path, self.thumb_size)
+            except Exception:
+                return None
+            self.cache.put(path, self.thumb_size, img)
+        return img
@@ -0,0 +1,85 @@
+import mmap
+import tempfile
+from array import array
+from PIL import Image
+
+# Compact in-memory side of the sorter's grid. Thumbnails are kept as raw
+# RGB bytes packed one after another in a single memory-mapped temporary
+# file, so pages not looked at lately can be dropped by the OS instead of
+# staying resident; Tk images are made from them only for cells in view.
+
+GROW_BYTES = 16 * 1024 * 1024
+
+
+class ThumbStore:
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.buffer = None
+        self.capacity = 0
+        self.used = 0
+        # Per slot: byte offset, width, height
+        self.offsets = array("Q")
+        self.widths = array("H")
+        self.heights = array("H")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, img):
+        # Returns the slot number the thumbnail is stored under
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        data = img.tobytes()
+        if self.used + len(data) > self.capacity:
+            self.grow(self.used + len(data))
+        self.buffer[self.used:self.used + len(data)] = data
+        self.offsets.append(self.used)
+        self.widths.append(img.width)
+        self.heights.append(img.height)
+        self.used += len(data)
+        return len(self.offsets) - 1
+
+    def grow(self, needed):
+        capacity = max(needed, self.capacity + GROW_BYTES, self.capacity * 2)
+        if self.buffer is not None:
+            self.buffer.close()
+        self.file.truncate(capacity)
+        self.buffer = mmap.mmap(self.file.fileno(), capacity)
+        self.capacity = capacity
+
+    def image(self, slot):
+        w, h = self.widths[slot], self.heights[slot]
+        offset = self.offsets[slot]
+        return Image.frombytes("RGB", (w, h), self.buffer[offset:offset + w * h * 3])
+
+    def clear(self):
+        # Slots from before are invalid afterwards; the space is reused
+        self.used = 0
+        del self.offsets[:], self.widths[:], self.heights[:]
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        self.file.close()
+
+
+class PhotoEntry:
+    # One grid cell. thumb is the ThumbStore slot (None until loaded), photo
+    # the Tk image while the cell is in view. dupes is the list of entries
+    # with identical content, shared by all of them, or None; similar
+    # likewise for near-duplicates, found from hash (the thumbnail's dHash).
+    # meta is the file's EXIF summary (see photo_meta), stamp the file's
+    # (size, mtime_ns) when its thumbnail was made.
+    __slots__ = ("filename", "thumb", "photo", "hash", "dupes", "similar", "meta", "stamp")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.thumb = None
+        self.photo = None
+        self.hash = None
+        self.dupes = None
+        self.similar = None
+        self.meta = None
+        self.stamp = None